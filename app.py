@@ -7,16 +7,62 @@ property of Lliam Khenzo P. Monleon. Unauthorized copying, distribution,
 modification, or use of this software is strictly prohibited.
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta, timezone
+import os
+import sys
+import threading
 import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from operator import itemgetter
+from urllib.parse import urlsplit
+import codecs
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import math
+import mmap
+import queue
+import sqlite3
+import tempfile
 import re
 import xml.etree.ElementTree as ET
 from bs4 import BeautifulSoup
-import re
+from lxml import etree
 import urllib3
 
+try:
+    import numpy as np
+except ImportError:
+    # Distance and region batches fall back to pure Python
+    np = None
+
+try:
+    import orjson
+except ImportError:
+    # Response bodies are encoded with Flask's JSON provider instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    # Clients that accept br are sent gzip instead
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): every process ingests for itself
+    fcntl = None
+
 # Disable SSL warnings for PHIVOLCS (they have cert issues)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -32,6 +78,13 @@ CEBU_MAX_LAT = 11.5
 CEBU_MIN_LON = 123.0
 CEBU_MAX_LON = 124.5
 
+# Named regions used to classify every earthquake: (min_lat, max_lat, min_lon, max_lon)
+REGIONS = {
+    'cebu': (CEBU_MIN_LAT, CEBU_MAX_LAT, CEBU_MIN_LON, CEBU_MAX_LON)
+}
+
+EARTH_RADIUS_KM = 6371
+
 # Philippines boundaries (wider area)
 PHILIPPINES_MIN_LAT = 4.0
 PHILIPPINES_MAX_LAT = 21.0
@@ -40,35 +93,968 @@ PHILIPPINES_MAX_LON = 127.0
 
 # Hazard Hunter API Configuration
 HAZARD_HUNTER_API_URL = "https://api.weather.gov/alerts/active"  # NOAA API
-PHIVOLCS_HAZARD_URL = "https://earthquake.phivolcs.dost.gov.ph/"
+NDRRMC_URL = "http://www.ndrrmc.gov.ph/"
+# The ingest cycle reuses the parsed NDRRMC updates for this long before
+# fetching the page again
+NDRRMC_CACHE_SECONDS = int(os.environ.get('NDRRMC_CACHE_SECONDS', 300))
+# PHIVOLCS pages tried in order until one responds
+PHIVOLCS_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+PHIVOLCS_URLS = [
+    "https://earthquake.phivolcs.dost.gov.ph/",
+    "https://www.phivolcs.dost.gov.ph/index.php/earthquake/earthquake-information3",
+    "https://www.phivolcs.dost.gov.ph/"
+]
+
+# PHIVOLCS earthquake table columns, recognised from the header row text
+PHIVOLCS_COLUMN_PATTERNS = (
+    ('datetime', re.compile(r'date|time', re.IGNORECASE)),
+    ('latitude', re.compile(r'lat', re.IGNORECASE)),
+    ('longitude', re.compile(r'lon', re.IGNORECASE)),
+    ('depth', re.compile(r'depth', re.IGNORECASE)),
+    ('magnitude', re.compile(r'mag', re.IGNORECASE)),
+    ('location', re.compile(r'location|place|epicenter', re.IGNORECASE))
+)
+PHIVOLCS_REQUIRED_COLUMNS = ('datetime', 'latitude', 'longitude', 'magnitude')
+PHIVOLCS_TIME_FORMATS = ('%d %B %Y - %I:%M %p', '%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S',
+                         '%m-%d-%Y %H:%M:%S', '%Y/%m/%d %H:%M:%S')
+PHIVOLCS_TIMEZONE = timezone(timedelta(hours=8))
+_PHIVOLCS_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+_PHIVOLCS_MAGNITUDE_RE = re.compile(r'^\d\.\d+$')
+_PHIVOLCS_SPACE_RE = re.compile(r'\s+')
+_PHIVOLCS_TIME_RE = re.compile(r'(\d{1,2})\s+([A-Za-z]+)\s+(\d{4})\s*-\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])$')
+_PHIVOLCS_MONTHS = {
+    month.lower(): number for number, month in enumerate(
+        ('January', 'February', 'March', 'April', 'May', 'June', 'July',
+         'August', 'September', 'October', 'November', 'December'), start=1)
+}
+
+# Logging level (DEBUG logs every matched event) and the client addresses
+# allowed to read /metrics
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+METRICS_ALLOWED_ADDRS = frozenset(os.environ.get('METRICS_ALLOWED_ADDRS', '127.0.0.1,::1').split(','))
+# When set, /metrics requires `Authorization: Bearer <token>` instead of an
+# allowed address. Set it behind a reverse proxy, where every client appears
+# to connect from the proxy's (usually loopback) address.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Background ingest configuration
+INGEST_INTERVAL_SECONDS = int(os.environ.get('INGEST_INTERVAL_SECONDS', 60))
+# A snapshot older than this (seeded from an old event store, or the ingest
+# thread was frozen by a serverless platform) is still served, but marked
+# stale. Requests never fetch upstream themselves.
+SNAPSHOT_MAX_AGE_SECONDS = INGEST_INTERVAL_SECONDS * 3
+# Worker processes on one host share snapshots through a file in this
+# directory: whichever holds the ingest lock there fetches and publishes,
+# the others map what it publishes. Set to '' for every process to ingest
+# for itself.
+SHARED_SNAPSHOT_DIR = os.environ.get('SHARED_SNAPSHOT_DIR', os.path.join(
+    tempfile.gettempdir(), 'linogtor-' + hashlib.sha1(os.path.abspath(__file__).encode('utf-8')).hexdigest()[:8]))
+# How often followers look for a newly published snapshot
+SHARED_SNAPSHOT_POLL_SECONDS = 1
+SHARED_SNAPSHOT_MAGIC = b'LNGTSNP1'
+EARTHQUAKE_SOURCES = ('usgs', 'phivolcs')
+
+# Server-Sent Events stream: comment heartbeat interval, and how long one
+# connection is held before the client is asked to reconnect (and resume
+# from its Last-Event-ID)
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_CONNECTION_SECONDS = 15 * 60
+SSE_DEFAULT_RADIUS_KM = 100
+# Whether the page opens /api/stream. Under gunicorn's threaded mode every
+# open stream pins a worker thread, so there the page only polls; the
+# endpoint itself stays available. Follows SERVING_MODE in gunicorn.conf.py.
+SSE_PAGE_ENABLED = os.environ.get('SERVING_MODE', 'gevent') != 'threaded'
+# Snapshot-derived response bodies are encoded once per snapshot and kept
+# raw, gzip- and brotli-compressed (least recently used first out). Bodies
+# smaller than RESPONSE_COMPRESS_MIN_BYTES are always sent uncompressed.
+RESPONSE_CACHE_ENTRIES = int(os.environ.get('RESPONSE_CACHE_ENTRIES', 64))
+RESPONSE_COMPRESS_MIN_BYTES = 1024
+RESPONSE_GZIP_LEVEL = 9
+RESPONSE_BROTLI_QUALITY = 9
+# Overall budget for one fetch_earthquake_data() call across all sources
+FETCH_DEADLINE_SECONDS = int(os.environ.get('FETCH_DEADLINE_SECONDS', 20))
+
+# Shared pool for upstream fetches. Deliberately not used as a context
+# manager: leaving a `with` block would wait on sources that overran the
+# deadline, which is exactly what the deadline is meant to avoid.
+_fetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upstream-fetch')
+
+# Cross-source association: reports from different sources are treated as
+# the same earthquake when their origin times, epicenters and magnitudes are
+# all within these tolerances. The origin from the earliest source in
+# ASSOCIATION_SOURCE_PREFERENCE is the one published.
+ASSOCIATION_TIME_SECONDS = float(os.environ.get('ASSOCIATION_TIME_SECONDS', 90))
+ASSOCIATION_DISTANCE_KM = float(os.environ.get('ASSOCIATION_DISTANCE_KM', 100))
+ASSOCIATION_MAGNITUDE = float(os.environ.get('ASSOCIATION_MAGNITUDE', 1.0))
+ASSOCIATION_SOURCE_PREFERENCE = ('USGS', 'PHIVOLCS')
+
+# USGS FDSN event service
+USGS_QUERY_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+USGS_WINDOW_DAYS = 7
+# Periodically re-pull the whole window in case an incremental poll missed something
+USGS_FULL_RESYNC_SECONDS = int(os.environ.get('USGS_FULL_RESYNC_SECONDS', 3600))
+# Incremental polls overlap the previous one to absorb clock skew with USGS
+USGS_POLL_OVERLAP_SECONDS = 120
+# USGS GeoJSON is decoded from the response stream in chunks of this size
+USGS_STREAM_CHUNK_BYTES = 64 * 1024
+_JSON_WHITESPACE_RE = re.compile(r'[ \t\r\n]*')
+
+# Persistent event store (SQLite). Set EVENT_DB_PATH to '' to disable, e.g.
+# on read-only serverless filesystems.
+EVENT_DB_PATH = os.environ.get('EVENT_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'earthquakes.db'))
+# Idle SQLite connections kept for reuse; more are opened while busy
+EVENT_STORE_POOL_SIZE = 4
+# Size of the spatial grid cells used to index stored events, in degrees
+EVENT_GRID_DEGREES = 0.5
+HISTORY_DEFAULT_DAYS = 30
+HISTORY_MAX_LIMIT = 10000
+
+# /api/earthquakes `region=` filters over a snapshot's EventTable, named
+# like the STATS_SCOPES they match
+EARTHQUAKE_REGION_FILTERS = {
+    'all': None,
+    'cebu': lambda table, rows: table.where('in_cebu', True, rows),
+    'bogo_100km': lambda table, rows: table.select('distance_from_bogo_km', None, 100, rows),
+    'bogo_50km': lambda table, rows: table.select('distance_from_bogo_km', None, 50, rows)
+}
+
+# Watchlist: named points and polygons with their own radius (km) and
+# magnitude threshold, matched against every ingested event. Entries from
+# the JSON list at WATCHLIST_PATH are added to (or replace, by id) these.
+WATCHLIST_PATH = os.environ.get('WATCHLIST_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'watchlist.json'))
+WATCHLIST_DEFAULT = [
+    {'id': 'bogo', 'name': 'Bogo City', 'lat': BOGO_CITY_LAT, 'lon': BOGO_CITY_LON, 'radius_km': 100},
+    {'id': 'cebu', 'name': 'Cebu Province', 'polygon': [(CEBU_MIN_LAT, CEBU_MIN_LON), (CEBU_MIN_LAT, CEBU_MAX_LON),
+                                                         (CEBU_MAX_LAT, CEBU_MAX_LON), (CEBU_MAX_LAT, CEBU_MIN_LON)]}
+]
+# Entries whose area overlaps more grid cells than this are tested against every event
+WATCHLIST_MAX_CELLS = 400
+
+# Upstream HTTP settings per host: timeout in seconds, retry budget for
+# connection errors and 5xx responses, and TLS verification (PHIVOLCS has
+# certificate issues). Hosts not listed here use UPSTREAM_DEFAULTS.
+UPSTREAM_DEFAULTS = {'timeout': 15, 'retries': 1, 'verify': True}
+UPSTREAM_HOSTS = {
+    'earthquake.usgs.gov': {'timeout': 10, 'retries': 2},
+    'earthquake.phivolcs.dost.gov.ph': {'timeout': 15, 'retries': 0, 'verify': False},
+    'www.phivolcs.dost.gov.ph': {'timeout': 15, 'retries': 0, 'verify': False},
+    'www.ndrrmc.gov.ph': {'timeout': 15, 'retries': 0}
+}
+UPSTREAM_POOL_SIZE = 4
+# Responses retried like connection errors, after 0.5s, 1s, 2s, ... backoff
+UPSTREAM_RETRY_STATUSES = (502, 503, 504)
+UPSTREAM_RETRY_BACKOFF_SECONDS = 0.5
+# Circuit breaker per upstream host: after BREAKER_FAILURE_THRESHOLD
+# consecutive failures the host is not called for BREAKER_BACKOFF_SECONDS,
+# then a single probe request is let through. Each failed probe doubles the
+# wait, up to BREAKER_MAX_BACKOFF_SECONDS.
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 3))
+BREAKER_BACKOFF_SECONDS = int(os.environ.get('BREAKER_BACKOFF_SECONDS', 30))
+BREAKER_MAX_BACKOFF_SECONDS = int(os.environ.get('BREAKER_MAX_BACKOFF_SECONDS', 900))
+# Concurrent requests for the same upstream resource share one fetch. When
+# there is last good data to fall back on, callers wait at most this long
+# for another's fetch before using it.
+UPSTREAM_COALESCE_WAIT_SECONDS = float(os.environ.get('UPSTREAM_COALESCE_WAIT_SECONDS', 5))
+
+# Local copy of the USGS 7-day window, as an EventTable
+_usgs_window = None
+_usgs_window_lock = threading.Lock()
+_usgs_last_poll = None
+_usgs_last_full_sync = 0.0
+
+# ---------------------------------------------------------------------------
+# Logging and metrics
+#
+# Log lines are "event key=value ..." at a level set by LOG_LEVEL, so the
+# per-event detail is only formatted when DEBUG is on. Metrics are kept in
+# process and rendered in the Prometheus text format by /metrics; each
+# gunicorn worker reports its own.
+# ---------------------------------------------------------------------------
+
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+logger = logging.getLogger('linogtor')
+
+# name -> (type, help); histograms use METRICS_BUCKETS
+METRICS = {
+    'linogtor_http_request_duration_seconds': ('histogram', 'API request latency by endpoint'),
+    'linogtor_http_requests_total': ('counter', 'API requests by endpoint and status code'),
+    'linogtor_source_fetch_duration_seconds': ('histogram', 'Time to fetch and parse one earthquake source'),
+    'linogtor_source_fetch_failures_total': ('counter', 'Earthquake source fetches that failed or timed out'),
+    'linogtor_upstream_request_duration_seconds': ('histogram', 'Upstream HTTP request time, excluding parsing, by host'),
+    'linogtor_upstream_bytes_total': ('counter', 'Response body bytes downloaded, by host'),
+    'linogtor_upstream_responses_total': ('counter', 'Upstream responses by host and cache result '
+                                          '(not_modified, unchanged, changed, circuit_open, coalesced, coalesce_timeout)'),
+    'linogtor_upstream_circuit_state': ('gauge', 'Circuit breaker state by host (0 closed, 1 half-open, 2 open)'),
+    'linogtor_parse_duration_seconds': ('histogram', 'Time spent in upstream response parsers'),
+    'linogtor_usgs_features_total': ('counter', 'USGS GeoJSON features decoded, by kind'),
+    'linogtor_phivolcs_rows_total': ('counter', 'PHIVOLCS table rows by parse outcome'),
+    'linogtor_association_input_events': ('gauge', 'Events from all sources before association, last ingest'),
+    'linogtor_association_output_events': ('gauge', 'Events after association, last ingest'),
+    'linogtor_ingest_duration_seconds': ('histogram', 'Time to refresh and publish one snapshot'),
+    'linogtor_response_cache_total': ('counter', 'Encoded response body lookups by result (hit, miss)'),
+    'linogtor_response_bytes_total': ('counter', 'Encoded response body bytes sent, by content encoding'),
+    'linogtor_snapshot_age_seconds': ('gauge', 'Age of the snapshot being served'),
+    'linogtor_snapshot_version': ('gauge', 'Version of the snapshot being served'),
+    'linogtor_snapshot_events': ('gauge', 'Earthquakes in the snapshot being served'),
+    'linogtor_source_last_success_age_seconds': ('gauge', 'Seconds since each source last fetched successfully')
+}
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# name -> {sorted label items: value}; histograms hold [bucket counts..., sum, count]
+_metrics = {name: {} for name in METRICS}
+_metrics_lock = threading.Lock()
+
+def metric_inc(name, value=1, **labels):
+    """Add to a counter"""
+    key = tuple(sorted(labels.items()))
+    with _metrics_lock:
+        series = _metrics[name]
+        series[key] = series.get(key, 0) + value
+
+def metric_set(name, value, **labels):
+    """Set a gauge"""
+    with _metrics_lock:
+        _metrics[name][tuple(sorted(labels.items()))] = value
+
+def metric_observe(name, value, **labels):
+    """Record one observation in a histogram"""
+    key = tuple(sorted(labels.items()))
+    with _metrics_lock:
+        series = _metrics[name]
+        if key not in series:
+            series[key] = [0] * (len(METRICS_BUCKETS) + 2)
+        histogram = series[key]
+        bucket = bisect_left(METRICS_BUCKETS, value)
+        if bucket < len(METRICS_BUCKETS):
+            histogram[bucket] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def render_metrics():
+    """Render every metric in the Prometheus text exposition format"""
+    with _metrics_lock:
+        current = {name: {key: list(value) if isinstance(value, list) else value for key, value in series.items()}
+                   for name, series in _metrics.items()}
+    
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(current[name].items()):
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {value[-1]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points in kilometers using Haversine formula"""
-    from math import radians, sin, cos, sqrt, atan2
-    
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    distance = R * c
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    distance = EARTH_RADIUS_KM * c
     
     return distance
 
-def fetch_usgs_data():
-    """Fetch earthquake data from USGS API"""
+def calculate_distances(lats, lons, ref_points):
+    """Haversine distances in km from many points to one or more reference points
+    
+    `lats`/`lons` are sequences of equal length and `ref_points` is a list of
+    (lat, lon). Returns a len(lats) x len(ref_points) array (a list of rows
+    when NumPy is unavailable).
+    """
+    if np is None:
+        return [[calculate_distance(ref_lat, ref_lon, lat, lon) for ref_lat, ref_lon in ref_points]
+                for lat, lon in zip(lats, lons)]
+    
+    lat = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    lon = np.radians(np.asarray(lons, dtype=np.float64))[:, None]
+    refs = np.radians(np.asarray(ref_points, dtype=np.float64).reshape(-1, 2))
+    ref_lat, ref_lon = refs[:, 0][None, :], refs[:, 1][None, :]
+    
+    a = np.sin((lat - ref_lat) / 2) ** 2 + np.cos(ref_lat) * np.cos(lat) * np.sin((lon - ref_lon) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def classify_regions(lats, lons, regions=REGIONS):
+    """Return {region name: booleans} telling which points fall in each box"""
+    if np is None:
+        return {
+            name: [min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in zip(lats, lons)]
+            for name, (min_lat, max_lat, min_lon, max_lon) in regions.items()
+        }
+    
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    return {
+        name: (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        for name, (min_lat, max_lat, min_lon, max_lon) in regions.items()
+    }
+
+def annotate_earthquakes(earthquakes):
+    """Fill in distance_from_bogo_km and in_cebu for a batch of new earthquake dicts"""
+    if not earthquakes:
+        return earthquakes
+    
+    lats = [eq['latitude'] for eq in earthquakes]
+    lons = [eq['longitude'] for eq in earthquakes]
+    distances = calculate_distances(lats, lons, [(BOGO_CITY_LAT, BOGO_CITY_LON)])
+    in_cebu = classify_regions(lats, lons)['cebu']
+    
+    for i, eq in enumerate(earthquakes):
+        eq['distance_from_bogo_km'] = round(float(distances[i][0]), 2)
+        eq['in_cebu'] = bool(in_cebu[i])
+    return earthquakes
+
+# ---------------------------------------------------------------------------
+# Columnar event table
+#
+# Snapshots and the USGS window hold their earthquakes column by column
+# rather than as one dict per event: numeric fields in typed arrays and the
+# rest in per-field lists of interned strings. Filters and aggregations run
+# over whole columns; dicts are only built when events are serialized.
+# ---------------------------------------------------------------------------
+
+# Typed columns (array module typecodes); every other field is an object column
+EVENT_NUMERIC_COLUMNS = {
+    'timestamp': 'q',
+    'latitude': 'd',
+    'longitude': 'd',
+    'depth': 'd',
+    'magnitude': 'd',
+    'distance_from_bogo_km': 'd'
+}
+# Marks a field absent from an event, as opposed to present with None
+_MISSING = object()
+
+class EventTable:
+    """Compact, column-oriented set of earthquakes
+    
+    Rows keep the order they were given in (newest first for ingested
+    data) and are addressed by position; `index` maps event ids to rows.
+    Missing or None numbers are stored as NaN and come back out as None.
+    """
+    
+    def __init__(self, earthquakes):
+        earthquakes = list(earthquakes)
+        self.fields = tuple(dict.fromkeys(key for eq in earthquakes for key in eq))
+        self.numeric = {}
+        self.objects = {}
+        
+        for field in self.fields:
+            if field in EVENT_NUMERIC_COLUMNS:
+                typecode = EVENT_NUMERIC_COLUMNS[field]
+                missing = float('nan') if typecode == 'd' else 0
+                self.numeric[field] = array(typecode, (
+                    missing if eq.get(field) is None else eq[field] for eq in earthquakes))
+            else:
+                self.objects[field] = [_intern(eq.get(field, _MISSING)) for eq in earthquakes]
+        
+        self._index()
+    
+    @classmethod
+    def from_columns(cls, fields, numeric, objects):
+        """Wrap existing columns without copying them
+        
+        `numeric` maps fields to buffers of EVENT_NUMERIC_COLUMNS typecodes
+        (arrays, or memoryviews of a shared snapshot file) and `objects` to
+        lists, as built by __init__.
+        """
+        table = cls.__new__(cls)
+        table.fields = tuple(fields)
+        table.numeric = numeric
+        table.objects = objects
+        table._index()
+        return table
+    
+    def _index(self):
+        self.ids = self.objects.get('id', [])
+        self.index = {event_id: row for row, event_id in enumerate(self.ids)}
+        
+        # Zero-copy NumPy views for vectorized filters
+        self.columns = dict(self.numeric)
+        if np is not None:
+            self.columns = {field: np.frombuffer(values, dtype=np.float64 if EVENT_NUMERIC_COLUMNS[field] == 'd' else np.int64)
+                            for field, values in self.numeric.items()}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __contains__(self, event_id):
+        return event_id in self.index
+    
+    def row(self, row, fields=None):
+        """Return one row as an earthquake dict, limited to `fields` if given"""
+        earthquake = {}
+        for field in self.fields if fields is None else fields:
+            if field in self.numeric:
+                value = self.numeric[field][row]
+                earthquake[field] = None if value != value else value
+            elif field in self.objects:
+                value = self.objects[field][row]
+                if value is not _MISSING:
+                    earthquake[field] = value
+        return earthquake
+    
+    def rows(self, rows=None, fields=None):
+        """Return earthquake dicts for the given rows (default: all, in order)"""
+        return [self.row(row, fields) for row in (range(len(self)) if rows is None else rows)]
+    
+    def get(self, event_id, fields=None):
+        """Return the earthquake dict for an event id, or None"""
+        row = self.index.get(event_id)
+        return None if row is None else self.row(row, fields)
+    
+    def select(self, field, low=None, high=None, rows=None):
+        """Return the rows, in table order, whose numeric `field` lies in [low, high]
+        
+        `rows` restricts the search to an earlier selection. Missing values
+        never match.
+        """
+        if field not in self.columns:
+            return [] if np is None else np.empty(0, dtype=np.intp)
+        values = self.columns[field]
+        
+        if np is not None:
+            rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.intp)
+            selected = values[rows]
+            mask = np.ones(len(rows), dtype=bool)
+            if low is not None:
+                mask &= selected >= low
+            if high is not None:
+                mask &= selected <= high
+            return rows[mask]
+        
+        return [row for row in (range(len(self)) if rows is None else rows)
+                if (low is None or values[row] >= low) and (high is None or values[row] <= high)]
+    
+    def where(self, field, value, rows=None):
+        """Return the rows, in table order, whose object `field` equals `value`"""
+        values = self.objects.get(field, ())
+        return [row for row in (range(len(self)) if rows is None else rows) if values[row] == value]
+    
+    def maximum(self, field, rows=None, default=0):
+        """Largest non-missing value of a numeric field over `rows` (default: all)"""
+        values = self._present(field, rows)
+        return default if len(values) == 0 else values.max().item() if np is not None else max(values)
+    
+    def _present(self, field, rows):
+        values = self.columns.get(field, ())
+        if np is not None:
+            values = np.asarray(values)
+            if rows is not None:
+                values = values[np.asarray(rows, dtype=np.intp)]
+            return values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+        if rows is not None:
+            values = [values[row] for row in rows]
+        return [value for value in values if value == value]
+
+def _intern(value):
+    """Intern strings so repeated values (sources, alerts, URLs) share storage"""
+    return sys.intern(value) if type(value) is str else value
+
+# ---------------------------------------------------------------------------
+# Upstream HTTP layer
+#
+# All upstream fetches go through one keep-alive session per host and are
+# made conditional on the ETag/Last-Modified of the previous response. A 304,
+# or a 200 whose body hashes the same as last time, returns the previously
+# parsed result without parsing again. Concurrent fetches of one resource
+# are coalesced into a single request whose result every caller shares.
+# ---------------------------------------------------------------------------
+
+_upstream_sessions = {}
+_upstream_sessions_lock = threading.Lock()
+_upstream_cache = {}
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling an upstream host whose circuit is open"""
+
+class CoalescedWaitTimeout(requests.Timeout):
+    """Raised to a caller that gave up waiting on another caller's fetch"""
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers share its outcome
+    
+    The first caller for a key makes the call. Callers arriving while it is
+    in flight wait for it and receive the same result or exception instead
+    of making their own.
+    """
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key, call, timeout=None):
+        """Return call(), or the result of the in-flight call for `key`
+        
+        Returns a tuple (result, shared). A waiting caller raises
+        CoalescedWaitTimeout after `timeout` seconds (None: no limit).
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+        
+        if leader:
+            try:
+                flight['result'] = call()
+            except BaseException as e:
+                flight['error'] = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                flight['done'].set()
+            return flight['result'], False
+        
+        if not flight['done'].wait(timeout):
+            raise CoalescedWaitTimeout(f'still in flight after {timeout}s: {key}')
+        if flight['error'] is not None:
+            raise flight['error']
+        return flight['result'], True
+
+_upstream_flights = SingleFlight()
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream host
+    
+    While closed every call goes through. BREAKER_FAILURE_THRESHOLD failures
+    in a row open it, and calls then fail fast until the backoff has passed.
+    The next call is let through as a probe (half-open) while the others
+    keep failing fast: a successful probe closes the breaker, a failed one
+    reopens it with twice the backoff.
+    """
+    STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+    
+    def __init__(self, host):
+        self.host = host
+        self.state = 'closed'
+        self.failures = 0
+        self.backoff = BREAKER_BACKOFF_SECONDS
+        self.retry_at = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """Whether a call may be made now; claims the probe when one is due"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() >= self.retry_at:
+                self._set_state('half_open')
+                logger.info('circuit probe host=%s', self.host)
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info('circuit closed host=%s', self.host)
+            self.failures = 0
+            self.backoff = BREAKER_BACKOFF_SECONDS
+            self._set_state('closed')
+    
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            if self.state == 'open':
+                return
+            if self.state == 'half_open':
+                self.backoff = min(self.backoff * 2, BREAKER_MAX_BACKOFF_SECONDS)
+            elif self.failures < BREAKER_FAILURE_THRESHOLD:
+                return
+            self.retry_at = time.time() + self.backoff
+            self._set_state('open')
+            logger.warning('circuit open host=%s failures=%d retry_in_s=%d error=%r',
+                           self.host, self.failures, self.backoff, self.last_error)
+    
+    def status(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'retry_in_seconds': max(0, round(self.retry_at - time.time(), 1)) if self.state == 'open' else None,
+            'last_error': self.last_error
+        }
+    
+    def _set_state(self, state):
+        self.state = state
+        metric_set('linogtor_upstream_circuit_state', self.STATES[state], host=self.host)
+
+def get_circuit_breaker(host):
+    """Return the circuit breaker for an upstream host"""
+    breaker = _circuit_breakers.get(host)
+    if breaker is not None:
+        return breaker
+    
+    with _circuit_breakers_lock:
+        return _circuit_breakers.setdefault(host, CircuitBreaker(host))
+
+def upstream_last_good(cache_key):
+    """Return (parsed, fetched_at) from the last successful fetch, or None"""
+    cached = _upstream_cache.get(cache_key)
+    return (cached['parsed'], cached['fetched_at']) if cached else None
+
+def _text_id(text):
+    """Stable id for a scraped post or advisory, the same in every process
+    
+    (The builtin hash() of a str is salted per process.)
+    """
+    return hashlib.sha1(text[:100].encode('utf-8')).hexdigest()[:12]
+
+def mark_stale(items):
+    """Copies of `items` flagged as served from a failed source's last good fetch"""
+    return [{**item, 'stale': True} for item in items]
+
+def upstream_config(host):
+    """Return timeout/retry/verify settings for an upstream host"""
+    return {**UPSTREAM_DEFAULTS, **UPSTREAM_HOSTS.get(host, {})}
+
+def get_upstream_session(host):
+    """Return the pooled keep-alive session for an upstream host"""
+    session = _upstream_sessions.get(host)
+    if session is not None:
+        return session
+    
+    with _upstream_sessions_lock:
+        if host not in _upstream_sessions:
+            # Retries are made by _upstream_get() so they can respect a deadline
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _upstream_sessions[host] = session
+        return _upstream_sessions[host]
+
+def _upstream_retry_delay(attempt, retries, deadline):
+    """Backoff before retrying after `attempt` (0-based), or None if the
+    retry budget is spent or the retry could not start before `deadline`"""
+    delay = UPSTREAM_RETRY_BACKOFF_SECONDS * 2 ** attempt
+    if attempt >= retries or (deadline is not None and time.monotonic() + delay >= deadline):
+        return None
+    return delay
+
+def _upstream_get(session, url, config, deadline, **kwargs):
+    """GET with the host's retry budget, never running past `deadline`
+    
+    Connection errors, timeouts and UPSTREAM_RETRY_STATUSES responses are
+    retried. Each attempt's timeout is the host timeout or the time left
+    before `deadline` (a time.monotonic() value), whichever is shorter.
+    Returns the last response, or raises the last error.
+    """
+    attempt = 0
+    while True:
+        timeout = config['timeout']
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise requests.Timeout(f'{url} not fetched before the deadline')
+        
+        try:
+            response = session.get(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            delay = _upstream_retry_delay(attempt, config['retries'], deadline)
+            if delay is None:
+                raise
+        else:
+            if response.status_code not in UPSTREAM_RETRY_STATUSES:
+                return response
+            delay = _upstream_retry_delay(attempt, config['retries'], deadline)
+            if delay is None:
+                return response
+            response.close()
+        
+        time.sleep(delay)
+        attempt += 1
+
+def upstream_fetch(url, parse, params=None, headers=None, cache_key=None, stream=False, deadline=None):
+    """GET an upstream resource and parse it, skipping the parse when unchanged
+    
+    `parse` receives the response and its return value is cached under
+    `cache_key` (default: the URL). Returns a tuple (parsed, changed).
+    Raises for connection errors and non-2xx responses.
+    
+    With `stream`, the body is never held in memory whole: `parse` receives
+    (response, chunks), where chunks iterates over the body and hashes it
+    as it is consumed. An unchanged body is then only detected after the
+    parse, but the cached result is still returned for it.
+    
+    Failures count against the host's circuit breaker; while it is open,
+    CircuitOpenError is raised without making a request. With `deadline` (a
+    time.monotonic() value), no attempt or retry runs past it.
+    
+    A call made while the same resource is already being fetched waits for
+    that fetch and returns its outcome. If a previous fetch succeeded, the
+    wait is bounded by UPSTREAM_COALESCE_WAIT_SECONDS, after which
+    CoalescedWaitTimeout is raised so the caller can use the last good data.
+    """
+    cache_key = cache_key or url
+    full_url = requests.Request('GET', url, params=params).prepare().url
+    timeout = UPSTREAM_COALESCE_WAIT_SECONDS if cache_key in _upstream_cache else None
+    
+    try:
+        result, shared = _upstream_flights.do(
+            (cache_key, full_url), lambda: _upstream_fetch(full_url, parse, headers, cache_key, stream, deadline),
+            timeout)
+    except CoalescedWaitTimeout:
+        metric_inc('linogtor_upstream_responses_total', host=urlsplit(full_url).hostname, result='coalesce_timeout')
+        raise
+    if shared:
+        metric_inc('linogtor_upstream_responses_total', host=urlsplit(full_url).hostname, result='coalesced')
+    return result
+
+def _upstream_fetch(full_url, parse, headers, cache_key, stream, deadline):
+    """Make one upstream_fetch() request; callers are already coalesced"""
+    host = urlsplit(full_url).hostname
+    config = upstream_config(host)
+    session = get_upstream_session(host)
+    request_headers = dict(headers or {})
+    
+    # Validators are only meaningful for the exact URL that issued them
+    cached = _upstream_cache.get(cache_key)
+    if cached and cached['url'] == full_url:
+        if cached['etag']:
+            request_headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            request_headers['If-Modified-Since'] = cached['last_modified']
+    
+    breaker = get_circuit_breaker(host)
+    if not breaker.allow():
+        metric_inc('linogtor_upstream_responses_total', host=host, result='circuit_open')
+        raise CircuitOpenError(f'{host} circuit open after {breaker.failures} consecutive failures')
+    parser = parse.__name__.lstrip('_')
+    
+    try:
+        started = time.perf_counter()
+        response = _upstream_get(session, full_url, config, deadline, headers=request_headers,
+                                 stream=stream, verify=config['verify'])
+        metric_observe('linogtor_upstream_request_duration_seconds', time.perf_counter() - started, host=host)
+        
+        with response:
+            if response.status_code == 304 and cached:
+                breaker.record_success()
+                metric_inc('linogtor_upstream_responses_total', host=host, result='not_modified')
+                cached['fetched_at'] = time.time()
+                return cached['parsed'], False
+            response.raise_for_status()
+            # The host answered; a body that fails to parse is not its outage
+            breaker.record_success()
+            
+            if stream:
+                digest = hashlib.sha1()
+                
+                def chunks():
+                    for chunk in response.iter_content(USGS_STREAM_CHUNK_BYTES):
+                        digest.update(chunk)
+                        metric_inc('linogtor_upstream_bytes_total', len(chunk), host=host)
+                        yield chunk
+                
+                # The body downloads while it is parsed, so this includes transfer time
+                started = time.perf_counter()
+                parsed = parse(response, chunks())
+                metric_observe('linogtor_parse_duration_seconds', time.perf_counter() - started, parser=parser)
+                body_hash = digest.hexdigest()
+                changed = not (cached and cached['body_hash'] == body_hash)
+                if not changed:
+                    parsed = cached['parsed']
+            else:
+                metric_inc('linogtor_upstream_bytes_total', len(response.content), host=host)
+                body_hash = hashlib.sha1(response.content).hexdigest()
+                if cached and cached['body_hash'] == body_hash:
+                    parsed = cached['parsed']
+                    changed = False
+                else:
+                    started = time.perf_counter()
+                    parsed = parse(response)
+                    metric_observe('linogtor_parse_duration_seconds', time.perf_counter() - started, parser=parser)
+                    changed = True
+    
+    except requests.RequestException as e:
+        breaker.record_failure(e)
+        raise
+    
+    metric_inc('linogtor_upstream_responses_total', host=host, result='changed' if changed else 'unchanged')
+    _upstream_cache[cache_key] = {
+        'url': full_url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'body_hash': body_hash,
+        'parsed': parsed,
+        'fetched_at': time.time()
+    }
+    return parsed, changed
+
+def _parse_usgs_feature(feature):
+    """Convert one USGS GeoJSON feature into our earthquake dict"""
+    props = feature['properties']
+    coords = feature['geometry']['coordinates']
+    
+    lon, lat, depth = coords[0], coords[1], coords[2]
+    
+    # distance_from_bogo_km and in_cebu are filled in per batch by annotate_earthquakes()
+    return {
+        'id': feature['id'],
+        'magnitude': props['mag'],
+        'place': props['place'],
+        'time': datetime.fromtimestamp(props['time']/1000).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        'timestamp': props['time'],
+        'latitude': lat,
+        'longitude': lon,
+        'depth': depth,
+        'distance_from_bogo_km': None,
+        'in_cebu': None,
+        'url': props['url'],
+        'alert': props.get('alert', 'none'),
+        'felt': props.get('felt', 0),
+        'source': 'USGS'
+    }
+
+def iter_geojson_features(chunks):
+    """Yield the features of a GeoJSON FeatureCollection as its bytes arrive
+    
+    Only the undecoded tail of the stream and the feature being decoded are
+    held in memory, however large the collection. Other top-level members
+    are decoded and discarded. Raises ValueError for malformed or truncated
+    input.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    exhausted = False
+    
+    def read_more():
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            raise ValueError('truncated GeoJSON stream')
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            text = text_decoder.decode(b'', final=True)
+        else:
+            text = text_decoder.decode(chunk)
+        buffer = buffer[pos:] + text
+        pos = 0
+    
+    def peek():
+        # Next non-whitespace character, without consuming it
+        nonlocal pos
+        while True:
+            pos = _JSON_WHITESPACE_RE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            read_more()
+    
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"expected {char!r} in GeoJSON stream at {buffer[pos:pos + 20]!r}")
+        pos += 1
+    
+    def read_value():
+        nonlocal pos
+        while True:
+            peek()
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+                read_more()
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(buffer) and not exhausted:
+                read_more()
+                continue
+            pos = end
+            return value
+    
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        key = read_value()
+        expect(':')
+        if key == 'features':
+            expect('[')
+            if peek() == ']':
+                pos += 1
+            else:
+                while True:
+                    yield read_value()
+                    if peek() == ']':
+                        pos += 1
+                        break
+                    expect(',')
+        else:
+            read_value()
+        if peek() == '}':
+            return
+        expect(',')
+
+def _parse_usgs_response(response, chunks):
+    """Split a streamed USGS GeoJSON response into (EventTable of updates, deleted ids)
+    
+    Features are converted one at a time as they are decoded, so only the
+    normalized earthquakes are kept, never the whole GeoJSON document.
+    """
+    # 204 means nothing matched (e.g. no updates since the last poll)
+    features = iter_geojson_features(chunks) if response.status_code != 204 else ()
+    
+    updated = []
+    deleted = []
+    for feature in features:
+        if feature['properties'].get('status') == 'deleted':
+            deleted.append(feature['id'])
+        else:
+            updated.append(_parse_usgs_feature(feature))
+    metric_inc('linogtor_usgs_features_total', len(updated), kind='updated')
+    metric_inc('linogtor_usgs_features_total', len(deleted), kind='deleted')
+    return EventTable(annotate_earthquakes(updated)), deleted
+
+def fetch_usgs_data(incremental=True, deadline=None):
+    """Fetch earthquake data from USGS API
+    
+    The 7-day window is kept locally in `_usgs_window`. After the first full
+    pull, polls only ask USGS for events updated since the previous poll,
+    upsert them by id and evict anything that has aged out of the window.
+    Requests and retries stop at `deadline` (a time.monotonic() value).
+    """
+    global _usgs_window, _usgs_last_poll, _usgs_last_full_sync
+    
     try:
-        end_time = datetime.now(timezone.utc)
-        start_time = end_time - timedelta(days=7)
+        poll_started = datetime.now(timezone.utc)
+        start_time = poll_started - timedelta(days=USGS_WINDOW_DAYS)
         
-        url = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+        full_sync = (not incremental or _usgs_last_poll is None or
+                     time.time() - _usgs_last_full_sync > USGS_FULL_RESYNC_SECONDS)
+        
+        # No endtime: a date-only endtime would cut off everything from today
         params = {
             'format': 'geojson',
-            'starttime': start_time.strftime('%Y-%m-%d'),
-            'endtime': end_time.strftime('%Y-%m-%d'),
+            'starttime': start_time.strftime('%Y-%m-%dT%H:%M:%S'),
             'minlatitude': PHILIPPINES_MIN_LAT,
             'maxlatitude': PHILIPPINES_MAX_LAT,
             'minlongitude': PHILIPPINES_MIN_LON,
@@ -76,55 +1062,54 @@ def fetch_usgs_data():
             'minmagnitude': 1.0,
             'orderby': 'time'
         }
+        if not full_sync:
+            updated_after = _usgs_last_poll - timedelta(seconds=USGS_POLL_OVERLAP_SECONDS)
+            params['updatedafter'] = updated_after.strftime('%Y-%m-%dT%H:%M:%S')
+            params['includedeleted'] = 'true'
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        (updated, deleted), changed = upstream_fetch(
+            USGS_QUERY_URL, _parse_usgs_response, params=params, stream=True,
+            cache_key='usgs:full' if full_sync else 'usgs:incremental', deadline=deadline)
         
-        earthquakes = []
-        for feature in data['features']:
-            props = feature['properties']
-            coords = feature['geometry']['coordinates']
-            
-            lon, lat, depth = coords[0], coords[1], coords[2]
+        cutoff_ms = int(start_time.timestamp() * 1000)
+        with _usgs_window_lock:
+            window = {}
+            if not full_sync and _usgs_window is not None:
+                window = {eq['id']: eq for eq in _usgs_window.rows()}
+            for earthquake in updated.rows():
+                window[earthquake['id']] = earthquake
+            for event_id in deleted:
+                window.pop(event_id, None)
+            expired = [event_id for event_id, eq in window.items() if eq['timestamp'] < cutoff_ms]
+            for event_id in expired:
+                del window[event_id]
             
-            # Calculate distance from Bogo City
-            distance_from_bogo = calculate_distance(BOGO_CITY_LAT, BOGO_CITY_LON, lat, lon)
-            
-            # Check if in Cebu area
-            in_cebu = (CEBU_MIN_LAT <= lat <= CEBU_MAX_LAT and 
-                      CEBU_MIN_LON <= lon <= CEBU_MAX_LON)
-            
-            earthquake = {
-                'id': feature['id'],
-                'magnitude': props['mag'],
-                'place': props['place'],
-                'time': datetime.fromtimestamp(props['time']/1000).strftime('%Y-%m-%d %H:%M:%S UTC'),
-                'timestamp': props['time'],
-                'latitude': lat,
-                'longitude': lon,
-                'depth': depth,
-                'distance_from_bogo_km': round(distance_from_bogo, 2),
-                'in_cebu': in_cebu,
-                'url': props['url'],
-                'alert': props.get('alert', 'none'),
-                'felt': props.get('felt', 0)
-            }
-            earthquakes.append(earthquake)
+            # Sort by time (most recent first)
+            earthquakes = sorted(window.values(), key=lambda x: x['timestamp'], reverse=True)
+            window_table = _usgs_window = EventTable(earthquakes)
+            _usgs_last_poll = poll_started
+            if full_sync:
+                _usgs_last_full_sync = time.time()
         
-        # Sort by time (most recent first)
-        earthquakes.sort(key=lambda x: x['timestamp'], reverse=True)
+        # Keep events USGS deleted out of /api/history and startup seeds. A
+        # full sync also catches deletions missed while nothing was polling.
+        if full_sync:
+            delete_stored_earthquakes(deleted, source='USGS', start_ms=cutoff_ms, keep_ids=window_table.ids)
+        elif deleted:
+            delete_stored_earthquakes(deleted)
         
-        print(f"USGS: Successfully fetched {len(earthquakes)} earthquakes")
-        if earthquakes:
-            print(f"  Sample earthquake: M{earthquakes[0]['magnitude']} at {earthquakes[0]['place']}")
-            print(f"  Cebu earthquakes in USGS data: {sum(1 for eq in earthquakes if eq['in_cebu'])}")
+        logger.info('usgs poll mode=%s features=%d deleted=%d expired=%d changed=%s window=%d',
+                    'full' if full_sync else 'incremental', len(updated) + len(deleted), len(deleted),
+                    len(expired), changed, len(earthquakes))
         
         return {
             'success': True,
             'earthquakes': earthquakes,
+            'table': window_table,
             'total_count': len(earthquakes),
             'cebu_count': sum(1 for eq in earthquakes if eq['in_cebu']),
+            'mode': 'full' if full_sync else 'incremental',
+            'updated_count': len(updated),
             'last_updated': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
         }
         
@@ -135,69 +1120,194 @@ def fetch_usgs_data():
             'earthquakes': []
         }
 
-def fetch_hazard_hunter_data():
-    """Fetch hazard/alert data for Bogo City area using geo-location"""
+# ---------------------------------------------------------------------------
+# PHIVOLCS acquisition
+#
+# The PHIVOLCS page is fetched and parsed once per ingest cycle into a plain
+# structure (tables, rows, text blocks). The earthquake parser, the news
+# extractor and the hazard extractor all read from it, and their results
+# are memoized on the page, which is itself cached by body hash in
+# upstream_fetch().
+# ---------------------------------------------------------------------------
+
+_phivolcs_page = None
+_phivolcs_page_fetched_at = 0.0
+_phivolcs_page_lock = threading.Lock()
+# Rows seen by the PHIVOLCS earthquake parser, by outcome
+phivolcs_row_stats = Counter()
+
+def _phivolcs_text(element):
+    """Return an element's text with whitespace collapsed"""
+    return ' '.join(''.join(element.itertext()).split())
+
+def _parse_phivolcs_page(response):
+    """Parse a PHIVOLCS page into tables, table rows and text blocks"""
+    root = etree.HTML(response.content)
+    if root is None:
+        raise ValueError('empty PHIVOLCS page')
+    
+    tables = []
+    for table in root.iter('table'):
+        header = []
+        rows = []
+        for row in table.iter('tr'):
+            cells = row.findall('td')
+            if cells:
+                rows.append([_phivolcs_text(cell) for cell in cells])
+            elif not header:
+                header = [_phivolcs_text(cell) for cell in row.findall('th')]
+        tables.append({'header': header, 'rows': rows})
+    
+    # Every non-empty text node with the full text of the element holding
+    # it, which is what the keyword extractors report
+    text_blocks = []
+    for element in root.iter():
+        if not isinstance(element.tag, str) or element.tag in ('script', 'style'):
+            continue
+        texts = [element.text] + [child.tail for child in element]
+        texts = [text.strip() for text in texts if text and text.strip()]
+        if texts:
+            element_text = _phivolcs_text(element)
+            text_blocks.extend((text, element_text) for text in texts)
+    
+    return {
+        'url': response.url,
+        'tables': tables,
+        'rows': [row for table in tables for row in table['rows']],
+        'text_blocks': text_blocks,
+        'derived': {}
+    }
+
+def get_phivolcs_page(refresh=False, stale_ok=False, deadline=None):
+    """Return the parsed PHIVOLCS page for this ingest cycle
+    
+    The page is re-fetched when `refresh` is set (the ingest path does this
+    once per cycle) or when the cached copy is older than one cycle.
+    Returns None if every PHIVOLCS URL fails, or with `stale_ok` the last
+    page fetched (see phivolcs_page_is_stale()) if there is one. No URL is
+    tried, and no request runs, past `deadline` (a time.monotonic() value).
+    
+    Callers arriving during a fetch wait for it and share its page, for
+    UPSTREAM_COALESCE_WAIT_SECONDS at most; only the refreshing ingest
+    path waits for the lock indefinitely.
+    """
+    global _phivolcs_page, _phivolcs_page_fetched_at
+    
+    wait = -1 if refresh else UPSTREAM_COALESCE_WAIT_SECONDS
+    if not _phivolcs_page_lock.acquire(timeout=wait):
+        page = _phivolcs_page if stale_ok else None
+        logger.warning('phivolcs page fetch still in flight, serving %s',
+                       'nothing' if page is None else f'stale age_s={int(time.time() - _phivolcs_page_fetched_at)}')
+        return page
+    
+    try:
+        if not refresh and _phivolcs_page is not None and \
+                time.time() - _phivolcs_page_fetched_at < INGEST_INTERVAL_SECONDS:
+            return _phivolcs_page
+        
+        for url in PHIVOLCS_URLS:
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.warning('phivolcs page deadline passed, not trying url=%s', url)
+                break
+            try:
+                logger.debug('phivolcs page try url=%s', url)
+                page, changed = upstream_fetch(url, _parse_phivolcs_page, headers=PHIVOLCS_HEADERS,
+                                               cache_key=f'phivolcs-page:{url}', deadline=deadline)
+                logger.info('phivolcs page ok url=%s changed=%s', url, changed)
+                _phivolcs_page = page
+                _phivolcs_page_fetched_at = time.time()
+                return page
+            except Exception as e:
+                logger.warning('phivolcs page failed url=%s error=%r', url, str(e))
+                continue
+        
+        if stale_ok and _phivolcs_page is not None:
+            logger.warning('phivolcs page stale age_s=%d', time.time() - _phivolcs_page_fetched_at)
+            return _phivolcs_page
+        return None
+    finally:
+        _phivolcs_page_lock.release()
+
+def phivolcs_page_is_stale():
+    """Whether the last PHIVOLCS fetch failed, so the cached page is past its cycle"""
+    return time.time() - _phivolcs_page_fetched_at >= INGEST_INTERVAL_SECONDS
+
+def phivolcs_page_extract(page, name, extract):
+    """Run an extractor over a parsed page once and memoize its result on the page"""
+    derived = page['derived']
+    if name not in derived:
+        derived[name] = extract(page)
+    return derived[name]
+
+def _extract_phivolcs_hazards(page):
+    """Extract Bogo/Cebu-related hazard advisories from a parsed PHIVOLCS page"""
+    hazards = []
+    
+    # Look for hazard warnings or advisories
+    hazard_keywords = ['advisory', 'warning', 'alert', 'hazard', 'tsunami', 'aftershock']
+    
+    for keyword in hazard_keywords:
+        pattern = re.compile(keyword, re.IGNORECASE)
+        matches = [parent_text for text, parent_text in page['text_blocks'] if pattern.search(text)]
+        
+        for text in matches[:3]:
+            if len(text) > 20:
+                # Check if it's related to Bogo or nearby areas
+                location_match = any(loc.lower() in text.lower() 
+                                   for loc in ['bogo', 'cebu', 'visayas', 'northern cebu'])
+                
+                if location_match:
+                    timestamp = datetime.now(timezone.utc)
+                    hazard_id = f'hazard_{keyword}_{_text_id(text)}'
+                    
+                    if not any(h['id'] == hazard_id for h in hazards):
+                        hazards.append({
+                            'id': hazard_id,
+                            'type': keyword.upper(),
+                            'location': 'Bogo City / Northern Cebu',
+                            'description': text[:500],
+                            'severity': 'MODERATE',
+                            'timestamp': int(timestamp.timestamp() * 1000),
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                            'coordinates': {
+                                'lat': BOGO_CITY_LAT,
+                                'lon': BOGO_CITY_LON
+                            },
+                            'source': 'PHIVOLCS Hazard Hunter'
+                        })
+                        
+                if len(hazards) >= 5:
+                    break
+        
+        if len(hazards) >= 5:
+            break
+    
+    return hazards
+
+def fetch_hazard_hunter_data(changed_at, upstream=True):
+    """Fetch hazard/alert data for Bogo City area using geo-location
+    
+    Runs on the ingest path; requests are served the result from the
+    snapshot. `changed_at` is when the earthquake data last changed. Without
+    `upstream` only the Bogo assessment is returned (for a seeded snapshot).
+    """
     try:
         hazards = []
         
         # Try PHIVOLCS Hazard maps and alerts
-        print("Fetching Hazard Hunter data...")
+        logger.debug('hazards fetch start')
         
         try:
             # PHIVOLCS Earthquake Hazard Information
-            url = "https://earthquake.phivolcs.dost.gov.ph/"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, timeout=15, verify=False, headers=headers)
-            
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Look for hazard warnings or advisories
-                hazard_keywords = ['advisory', 'warning', 'alert', 'hazard', 'tsunami', 'aftershock']
-                
-                for keyword in hazard_keywords:
-                    elements = soup.find_all(text=re.compile(keyword, re.IGNORECASE))
-                    
-                    for element in elements[:3]:
-                        parent = element.find_parent()
-                        if parent:
-                            text = parent.get_text(strip=True)
-                            if len(text) > 20:
-                                # Check if it's related to Bogo or nearby areas
-                                location_match = any(loc.lower() in text.lower() 
-                                                   for loc in ['bogo', 'cebu', 'visayas', 'northern cebu'])
-                                
-                                if location_match:
-                                    timestamp = datetime.now(timezone.utc)
-                                    hazard_id = f'hazard_{keyword}_{hash(text[:100])}'
-                                    
-                                    if not any(h['id'] == hazard_id for h in hazards):
-                                        hazards.append({
-                                            'id': hazard_id,
-                                            'type': keyword.upper(),
-                                            'location': 'Bogo City / Northern Cebu',
-                                            'description': text[:500],
-                                            'severity': 'MODERATE',
-                                            'timestamp': int(timestamp.timestamp() * 1000),
-                                            'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
-                                            'coordinates': {
-                                                'lat': BOGO_CITY_LAT,
-                                                'lon': BOGO_CITY_LON
-                                            },
-                                            'source': 'PHIVOLCS Hazard Hunter'
-                                        })
-                                        
-                                if len(hazards) >= 5:
-                                    break
-                    
-                    if len(hazards) >= 5:
-                        break
+            # (the page shared with the earthquake and news extractors)
+            page = get_phivolcs_page(stale_ok=True) if upstream else None
+            if page is not None:
+                page_hazards = phivolcs_page_extract(page, 'hazards', _extract_phivolcs_hazards)
+                hazards.extend(mark_stale(page_hazards) if phivolcs_page_is_stale() else page_hazards)
                         
-            print(f"Hazard Hunter: Found {len(hazards)} hazard alerts")
+            logger.info('hazards ok alerts=%d', len(hazards))
         except Exception as e:
-            print(f"Error fetching Hazard Hunter data: {e}")
+            logger.warning('hazards failed error=%r', str(e))
         
         # Add geo-location based earthquake hazard assessment
         try:
@@ -210,8 +1320,11 @@ def fetch_hazard_hunter_data():
                 'location': f'Bogo City ({BOGO_CITY_LAT}°N, {BOGO_CITY_LON}°E)',
                 'description': 'Real-time seismic hazard assessment for Bogo City based on recent earthquake activity and geological data.',
                 'severity': 'MONITORING',
-                'timestamp': int(datetime.now(timezone.utc).timestamp() * 1000),
-                'time': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+                # When the earthquake data last changed, not the ingest time,
+                # so the body (and its ETag) stays the same until there is
+                # something new to assess
+                'timestamp': int(changed_at * 1000),
+                'time': _format_utc(changed_at),
                 'coordinates': {
                     'lat': BOGO_CITY_LAT,
                     'lon': BOGO_CITY_LON
@@ -220,148 +1333,153 @@ def fetch_hazard_hunter_data():
             })
             
         except Exception as e:
-            print(f"Error creating hazard assessment: {e}")
+            logger.warning('hazard assessment failed error=%r', str(e))
         
         return hazards
         
-    except Exception as e:
-        print(f"Error in fetch_hazard_hunter_data: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception('fetch_hazard_hunter_data failed')
         return []
 
-def fetch_phivolcs_facebook_posts():
-    """Fetch PHIVOLCS information about Bogo City from their website and recent earthquake data"""
+def _extract_phivolcs_cebu_posts(page):
+    """Turn PHIVOLCS table rows that mention Cebu/Bogo into news posts"""
+    posts = []
+    
+    for cells in page['rows']:
+        if len(cells) >= 4:
+            try:
+                # Extract earthquake data
+                row_text = ' '.join(cells)
+                
+                # Check if location mentions Bogo or Northern Cebu
+                if 'bogo' in row_text.lower() or 'northern cebu' in row_text.lower() or 'cebu' in row_text.lower():
+                    timestamp = datetime.now(timezone.utc)
+                    
+                    content = f"🌍 Earthquake detected in Cebu region\n"
+                    content += f"� Details: {row_text}\n"
+                    content += f"� Monitored by PHIVOLCS for City of Bogo safety"
+                    
+                    post_id = f'phivolcs_bogo_{_text_id(content)}'
+                    
+                    if not any(p['id'] == post_id for p in posts):
+                        posts.append({
+                            'id': post_id,
+                            'source': 'PHIVOLCS - Cebu Region',
+                            'content': content,
+                            'timestamp': int(timestamp.timestamp() * 1000),
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                            'url': page['url']
+                        })
+                    
+                    if len(posts) >= 5:
+                        break
+                        
+            except Exception as e:
+                logger.debug('phivolcs news row skipped error=%r', str(e))
+                continue
+    
+    return posts
+
+def _parse_ndrrmc_updates(response):
+    """Extract earthquake updates mentioning Bogo or Northern Cebu from NDRRMC"""
+    posts = []
+    soup = BeautifulSoup(response.content, 'html.parser')
+    
+    # Look for earthquake updates mentioning Bogo or Northern Cebu
+    keywords = ['Bogo', 'Northern Cebu', 'Cebu.*earthquake', 'Cebu.*magnitude']
+    
+    for keyword in keywords:
+        updates = soup.find_all(text=re.compile(keyword, re.IGNORECASE))
+        
+        for update in updates[:3]:
+            parent = update.find_parent()
+            if parent:
+                text = parent.get_text(strip=True)
+                if len(text) > 30:
+                    timestamp = datetime.now(timezone.utc)
+                    post_id = f'ndrrmc_update_{_text_id(text)}'
+                    
+                    if not any(p['id'] == post_id for p in posts):
+                        posts.append({
+                            'id': post_id,
+                            'source': 'NDRRMC',
+                            'content': text[:600],
+                            'timestamp': int(timestamp.timestamp() * 1000),
+                            'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                            'url': NDRRMC_URL
+                        })
+                        
+                if len(posts) >= 8:
+                    break
+        
+        if len(posts) >= 8:
+            break
+    
+    return posts
+
+def get_ndrrmc_updates():
+    """Return NDRRMC updates, fetched at most once per NDRRMC_CACHE_SECONDS
+    
+    If a fetch fails, the last good updates are returned marked stale.
+    """
+    last_good = upstream_last_good('ndrrmc')
+    if last_good is not None and time.time() - last_good[1] < NDRRMC_CACHE_SECONDS:
+        return last_good[0]
+    
+    try:
+        updates, _ = upstream_fetch(NDRRMC_URL, _parse_ndrrmc_updates, cache_key='ndrrmc')
+        return updates
+    except requests.RequestException as e:
+        if last_good is None:
+            raise
+        logger.warning('news ndrrmc stale error=%r', str(e))
+        return mark_stale(last_good[0])
+
+def fetch_phivolcs_facebook_posts(changed_at, upstream=True):
+    """Fetch PHIVOLCS information about Bogo City from their website and recent earthquake data
+    
+    Runs on the ingest path; requests are served the result from the
+    snapshot. `changed_at` (when the earthquake data last changed) stamps
+    the default post. Without `upstream` only the default post is returned.
+    """
     try:
         posts = []
         
-        print("Fetching PHIVOLCS information for City of Bogo...")
+        logger.debug('news fetch start')
         
         # 1. Check latest earthquakes from PHIVOLCS for Bogo City area
         try:
-            # Try multiple PHIVOLCS URLs
-            urls_to_try = [
-                "https://earthquake.phivolcs.dost.gov.ph/",
-                "https://www.phivolcs.dost.gov.ph/index.php/earthquake/earthquake-information3",
-                "https://www.phivolcs.dost.gov.ph/"
-            ]
-            
-            soup = None
-            working_url = None
-            
-            for url in urls_to_try:
-                try:
-                    print(f"Trying PHIVOLCS URL for Bogo news: {url}")
-                    response = requests.get(url, timeout=15, verify=False)
-                    if response.status_code == 200:
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        working_url = url
-                        print(f"Success with URL: {url}")
-                        break
-                except Exception as e:
-                    print(f"Failed with {url}: {e}")
-                    continue
-            
-            if soup and working_url:
-                # Bogo City coordinates: 11.0333°N, 124.0167°E
-                bogo_lat = 11.0333
-                bogo_lon = 124.0167
-                
-                # Parse earthquake table
-                rows = soup.find_all('tr')
-                
-                for row in rows:
-                    cells = row.find_all('td')
-                    if len(cells) >= 4:
-                        try:
-                            # Extract earthquake data
-                            row_text = ' '.join(cell.get_text(strip=True) for cell in cells)
+            page = get_phivolcs_page(stale_ok=True) if upstream else None
+            if page is not None:
+                page_posts = phivolcs_page_extract(page, 'cebu_posts', _extract_phivolcs_cebu_posts)
+                posts.extend(mark_stale(page_posts) if phivolcs_page_is_stale() else page_posts)
                             
-                            # Check if location mentions Bogo or Northern Cebu
-                            if 'bogo' in row_text.lower() or 'northern cebu' in row_text.lower() or 'cebu' in row_text.lower():
-                                timestamp = datetime.now(timezone.utc)
-                                
-                                content = f"🌍 Earthquake detected in Cebu region\n"
-                                content += f"� Details: {row_text}\n"
-                                content += f"� Monitored by PHIVOLCS for City of Bogo safety"
-                                
-                                post_id = f'phivolcs_bogo_{hash(content[:100])}'
-                                
-                                if not any(p['id'] == post_id for p in posts):
-                                    posts.append({
-                                        'id': post_id,
-                                        'source': 'PHIVOLCS - Cebu Region',
-                                        'content': content,
-                                        'timestamp': int(timestamp.timestamp() * 1000),
-                                        'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
-                                        'url': working_url
-                                    })
-                                
-                                if len(posts) >= 5:
-                                    break
-                                    
-                        except Exception as e:
-                            print(f"Error parsing earthquake row: {e}")
-                            continue
-                            
-            print(f"PHIVOLCS Bogo Data: Found {len(posts)} earthquake entries")
+            logger.debug('news phivolcs posts=%d', len(posts))
         except Exception as e:
-            print(f"Error fetching PHIVOLCS earthquake data: {e}")
+            logger.warning('news phivolcs failed error=%r', str(e))
         
         # 2. NDRRMC Updates for City of Bogo
         try:
-            print("Fetching NDRRMC updates...")
-            ndrrmc_url = "http://www.ndrrmc.gov.ph/"
-            response = requests.get(ndrrmc_url, timeout=15)
-            
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Look for earthquake updates mentioning Bogo or Northern Cebu
-                keywords = ['Bogo', 'Northern Cebu', 'Cebu.*earthquake', 'Cebu.*magnitude']
-                
-                for keyword in keywords:
-                    updates = soup.find_all(text=re.compile(keyword, re.IGNORECASE))
-                    
-                    for update in updates[:3]:
-                        parent = update.find_parent()
-                        if parent:
-                            text = parent.get_text(strip=True)
-                            if len(text) > 30:
-                                timestamp = datetime.now(timezone.utc)
-                                post_id = f'ndrrmc_update_{hash(text[:100])}'
-                                
-                                if not any(p['id'] == post_id for p in posts):
-                                    posts.append({
-                                        'id': post_id,
-                                        'source': 'NDRRMC',
-                                        'content': text[:600],
-                                        'timestamp': int(timestamp.timestamp() * 1000),
-                                        'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
-                                        'url': ndrrmc_url
-                                    })
-                                    
-                            if len(posts) >= 8:
-                                break
-                    
-                    if len(posts) >= 8:
-                        break
+            updates = get_ndrrmc_updates() if upstream else []
+            for update in updates:
+                if len(posts) >= 8:
+                    break
+                if not any(p['id'] == update['id'] for p in posts):
+                    posts.append(update)
                         
-            print(f"NDRRMC: Total posts now {len(posts)}")
+            logger.debug('news ndrrmc posts=%d', len(posts))
         except Exception as e:
-            print(f"Error fetching NDRRMC: {e}")
+            logger.warning('news ndrrmc failed error=%r', str(e))
         
         # 3. Additional PHIVOLCS sources (if main URLs don't have Bogo data)
         if len(posts) < 3:
             try:
-                print("Checking additional PHIVOLCS sources...")
+                logger.debug('news checking additional sources')
                 # Use USGS data filtered for Cebu region as backup
                 # This ensures we always have something to show
                 
             except Exception as e:
-                print(f"Error fetching additional sources: {e}")
-            
-            print(f"PHIVOLCS Latest: Total posts now {len(posts)}")
+                logger.warning('news additional sources failed error=%r', str(e))
         
         # Remove duplicates based on content similarity
         unique_posts = []
@@ -378,170 +1496,355 @@ def fetch_phivolcs_facebook_posts():
         # Sort by timestamp (newest first)
         unique_posts.sort(key=lambda x: x['timestamp'], reverse=True)
         
-        print(f"PHIVOLCS Posts about City of Bogo: Found {len(unique_posts)} unique posts")
+        logger.info('news ok posts=%d', len(unique_posts))
         
         # If no posts found, add a default informational message
+        # Stamped like the Bogo hazard assessment, so an unchanged "no news"
+        # body keeps its ETag
         if len(unique_posts) == 0:
-            timestamp = datetime.now(timezone.utc)
             unique_posts.append({
                 'id': 'default_no_news',
                 'source': 'PHIVOLCS Monitor',
                 'content': '✅ No recent earthquake activity reported in City of Bogo. System is actively monitoring PHIVOLCS data sources for updates.',
-                'timestamp': int(timestamp.timestamp() * 1000),
-                'time': timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                'timestamp': int(changed_at * 1000),
+                'time': _format_utc(changed_at),
                 'url': 'https://earthquake.phivolcs.dost.gov.ph/'
             })
         
         return unique_posts[:10]  # Return max 10 posts
         
-    except Exception as e:
-        print(f"Error in fetch_phivolcs_facebook_posts: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception('fetch_phivolcs_facebook_posts failed')
         return []
 
-def fetch_phivolcs_data():
-    """Fetch earthquake data from PHIVOLCS"""
+def _phivolcs_column_schema(header):
+    """Map earthquake fields to column positions from a table's header row
+    
+    Returns None unless every field in PHIVOLCS_REQUIRED_COLUMNS is found.
+    """
+    schema = {}
+    for index, text in enumerate(header):
+        for field, pattern in PHIVOLCS_COLUMN_PATTERNS:
+            if field not in schema and pattern.search(text):
+                schema[field] = index
+                break
+    
+    if all(field in schema for field in PHIVOLCS_REQUIRED_COLUMNS):
+        return schema
+    return None
+
+def _parse_phivolcs_time(text, formats):
+    """Parse a PHIVOLCS date/time cell as Philippine time
+    
+    The usual "17 October 2025 - 09:41 AM" layout is matched with a compiled
+    pattern. Anything else goes through `formats`, which is reordered so the
+    format that last matched is tried first.
+    """
+    match = _PHIVOLCS_TIME_RE.match(text)
+    if match and match.group(2).lower() in _PHIVOLCS_MONTHS:
+        day, month, year, hour, minute, meridiem = match.groups()
+        hour = int(hour) % 12 + (12 if meridiem.upper() == 'PM' else 0)
+        return datetime(int(year), _PHIVOLCS_MONTHS[month.lower()], int(day), hour, int(minute),
+                        tzinfo=PHIVOLCS_TIMEZONE)
+    
+    text = _PHIVOLCS_SPACE_RE.sub(' ', text)
+    for i, fmt in enumerate(formats):
+        try:
+            eq_datetime = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if i:
+            formats.insert(0, formats.pop(i))
+        return eq_datetime.replace(tzinfo=PHIVOLCS_TIMEZONE)
+    raise ValueError(f"unrecognised time {text!r}")
+
+def _parse_phivolcs_coordinate(text, negative):
+    """Parse a latitude/longitude cell, negating it for the S or W hemisphere"""
+    match = _PHIVOLCS_NUMBER_RE.search(text)
+    if not match:
+        raise ValueError(f"no number in {text!r}")
+    value = float(match.group())
+    return -value if negative in text else value
+
+def _phivolcs_earthquake(eq_datetime, lat, lon, depth, magnitude, location):
+    """Build an earthquake record from parsed PHIVOLCS fields"""
+    # distance_from_bogo_km and in_cebu are filled in per batch
+    return {
+        'id': f'phivolcs_{eq_datetime.timestamp()}_{lat}_{lon}',
+        'magnitude': magnitude,
+        'place': location,
+        'time': eq_datetime.strftime('%Y-%m-%d %H:%M:%S PST'),
+        'timestamp': int(eq_datetime.timestamp() * 1000),
+        'latitude': lat,
+        'longitude': lon,
+        'depth': depth,
+        'distance_from_bogo_km': None,
+        'in_cebu': None,
+        'url': 'https://earthquake.phivolcs.dost.gov.ph/',
+        'alert': 'none',
+        'felt': 0,
+        'source': 'PHIVOLCS'
+    }
+
+def _parse_phivolcs_row(cells, schema, time_formats):
+    """Parse one table row positionally using its table's column schema
+    
+    Raises ValueError naming the field that could not be parsed.
+    """
+    field = None
     try:
-        earthquakes = []
+        field = 'datetime'
+        eq_datetime = _parse_phivolcs_time(cells[schema['datetime']], time_formats)
+        field = 'latitude'
+        lat = _parse_phivolcs_coordinate(cells[schema['latitude']], 'S')
+        field = 'longitude'
+        lon = _parse_phivolcs_coordinate(cells[schema['longitude']], 'W')
+        field = 'magnitude'
+        magnitude = float(_PHIVOLCS_NUMBER_RE.search(cells[schema['magnitude']]).group())
         
-        # Updated PHIVOLCS URLs - try multiple sources
-        urls_to_try = [
-            "https://earthquake.phivolcs.dost.gov.ph/",
-            "https://www.phivolcs.dost.gov.ph/index.php/earthquake/earthquake-information3",
-            "https://www.phivolcs.dost.gov.ph/"
-        ]
+        depth = 10.0  # Default depth
+        if 'depth' in schema:
+            field = 'depth'
+            match = _PHIVOLCS_NUMBER_RE.search(cells[schema['depth']])
+            if match:
+                depth = float(match.group())
         
-        response = None
-        for url in urls_to_try:
-            try:
-                print(f"Trying PHIVOLCS URL: {url}")
-                response = requests.get(url, timeout=15, verify=False)
-                if response.status_code == 200:
-                    print(f"Success with URL: {url}")
-                    break
-            except Exception as e:
-                print(f"Failed with {url}: {e}")
-                continue
+        location = "Philippines"
+        if 'location' in schema and cells[schema['location']]:
+            location = cells[schema['location']]
+    except IndexError:
+        raise ValueError('short_row')
+    except (ValueError, AttributeError):
+        raise ValueError(f'bad_{field}')
+    
+    if not (lat > 0 and lon > 0 and magnitude > 0):
+        raise ValueError('out_of_range')
+    
+    return _phivolcs_earthquake(eq_datetime, lat, lon, depth, magnitude, location)
+
+def _parse_phivolcs_row_heuristic(col_texts):
+    """Guess earthquake fields from cell contents for tables without a usable header
+    
+    Returns None when the row does not look like an earthquake.
+    """
+    lat = None
+    lon = None
+    magnitude = None
+    depth = 10.0  # Default depth
+    eq_datetime = None
+    location = "Philippines"
+    
+    # Parse each column
+    for text in col_texts:
+        # Look for latitude (contains N or S)
+        if ('N' in text or 'S' in text) and lat is None:
+            lat_match = _PHIVOLCS_NUMBER_RE.search(text)
+            if lat_match:
+                lat = float(lat_match.group())
+                if 'S' in text:
+                    lat = -lat
         
-        if not response or response.status_code != 200:
-            print("All PHIVOLCS URLs failed, using USGS data only")
-            return []
+        # Look for longitude (contains E or W)
+        elif ('E' in text or 'W' in text) and lon is None:
+            lon_match = _PHIVOLCS_NUMBER_RE.search(text)
+            if lon_match:
+                lon = float(lon_match.group())
+                if 'W' in text:
+                    lon = -lon
+        
+        # Look for magnitude (small decimal number, usually 1-9)
+        elif magnitude is None and _PHIVOLCS_MAGNITUDE_RE.match(text):
+            magnitude = float(text)
+        
+        # Look for depth (km)
+        elif 'km' in text.lower() and depth == 10.0:
+            depth_match = _PHIVOLCS_NUMBER_RE.search(text)
+            if depth_match:
+                depth = float(depth_match.group())
         
-        # Parse the HTML content
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Look for date/time
+        elif '-' in text and ':' in text and eq_datetime is None:
+            for fmt in PHIVOLCS_TIME_FORMATS:
+                try:
+                    eq_datetime = datetime.strptime(text, fmt)
+                    break
+                except ValueError:
+                    continue
         
-        # Find all tables (PHIVOLCS usually has earthquake data in tables)
-        tables = soup.find_all('table')
+        # Location is usually longer text
+        elif len(text) > 10 and location == "Philippines":
+            location = text
+    
+    # Validate we have minimum required data
+    if not (lat and lon and magnitude and lat > 0 and lon > 0):
+        return None
+    
+    # Use current time if datetime not found
+    if not eq_datetime:
+        eq_datetime = datetime.now(timezone.utc)
+    
+    return _phivolcs_earthquake(eq_datetime, lat, lon, depth, magnitude, location)
+
+def _extract_phivolcs_earthquakes(page):
+    """Parse earthquake rows out of the tables on a parsed PHIVOLCS page
+    
+    Tables whose header row names the earthquake columns are parsed
+    positionally; any other table falls back to guessing per cell. Rows
+    that fail are counted by reason in phivolcs_row_stats.
+    """
+    earthquakes = []
+    stats = Counter()
+    
+    for table in page['tables']:
+        rows = table['rows']
+        schema = _phivolcs_column_schema(table['header'])
+        if schema is None and rows:
+            # Some layouts put the header in the first <td> row
+            schema = _phivolcs_column_schema(rows[0])
+            if schema is not None:
+                rows = rows[1:]
         
-        for table in tables:
-            rows = table.find_all('tr')
+        time_formats = list(PHIVOLCS_TIME_FORMATS)
+        for cells in rows:
+            if len(cells) < 6:  # Must have at least date, time, lat, lon, depth, mag
+                stats['skipped'] += 1
+                continue
             
-            for row in rows:
-                cols = row.find_all('td')
-                if len(cols) >= 6:  # Must have at least date, time, lat, lon, depth, mag
-                    try:
-                        # Try to parse earthquake data
-                        # Common PHIVOLCS format: Date | Time | Latitude | Longitude | Depth | Magnitude | Location
-                        
-                        # Extract text from columns
-                        col_texts = [col.text.strip() for col in cols]
-                        
-                        # Try to identify columns with coordinates and magnitude
-                        lat = None
-                        lon = None
-                        magnitude = None
-                        depth = 10.0  # Default depth
-                        eq_datetime = None
-                        location = "Philippines"
-                        
-                        # Parse each column
-                        for i, text in enumerate(col_texts):
-                            # Look for latitude (contains N or S)
-                            if ('N' in text or 'S' in text) and lat is None:
-                                lat_match = re.search(r'([\d.]+)', text)
-                                if lat_match:
-                                    lat = float(lat_match.group(1))
-                                    if 'S' in text:
-                                        lat = -lat
-                            
-                            # Look for longitude (contains E or W)
-                            elif ('E' in text or 'W' in text) and lon is None:
-                                lon_match = re.search(r'([\d.]+)', text)
-                                if lon_match:
-                                    lon = float(lon_match.group(1))
-                                    if 'W' in text:
-                                        lon = -lon
-                            
-                            # Look for magnitude (small decimal number, usually 1-9)
-                            elif magnitude is None and re.match(r'^\d\.\d+$', text):
-                                magnitude = float(text)
-                            
-                            # Look for depth (km)
-                            elif 'km' in text.lower() and depth == 10.0:
-                                depth_match = re.search(r'([\d.]+)', text)
-                                if depth_match:
-                                    depth = float(depth_match.group(1))
-                            
-                            # Look for date/time
-                            elif '-' in text and ':' in text and eq_datetime is None:
-                                try:
-                                    # Try various date formats
-                                    for fmt in ['%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S', 
-                                               '%m-%d-%Y %H:%M:%S', '%Y/%m/%d %H:%M:%S']:
-                                        try:
-                                            eq_datetime = datetime.strptime(text, fmt)
-                                            break
-                                        except:
-                                            continue
-                                except:
-                                    pass
-                            
-                            # Location is usually longer text
-                            elif len(text) > 10 and location == "Philippines":
-                                location = text
-                        
-                        # Validate we have minimum required data
-                        if lat and lon and magnitude and lat > 0 and lon > 0:
-                            # Use current time if datetime not found
-                            if not eq_datetime:
-                                eq_datetime = datetime.now(timezone.utc)
-                            
-                            # Calculate distance from Bogo City
-                            distance_from_bogo = calculate_distance(BOGO_CITY_LAT, BOGO_CITY_LON, lat, lon)
-                            
-                            # Check if in Cebu area
-                            in_cebu = (CEBU_MIN_LAT <= lat <= CEBU_MAX_LAT and 
-                                      CEBU_MIN_LON <= lon <= CEBU_MAX_LON)
-                            
-                            earthquake = {
-                                'id': f'phivolcs_{eq_datetime.timestamp()}_{lat}_{lon}',
-                                'magnitude': magnitude,
-                                'place': location,
-                                'time': eq_datetime.strftime('%Y-%m-%d %H:%M:%S PST'),
-                                'timestamp': int(eq_datetime.timestamp() * 1000),
-                                'latitude': lat,
-                                'longitude': lon,
-                                'depth': depth,
-                                'distance_from_bogo_km': round(distance_from_bogo, 2),
-                                'in_cebu': in_cebu,
-                                'url': 'https://earthquake.phivolcs.dost.gov.ph/',
-                                'alert': 'none',
-                                'felt': 0,
-                                'source': 'PHIVOLCS'
-                            }
-                            earthquakes.append(earthquake)
-                        
-                    except (ValueError, IndexError, AttributeError) as e:
+            try:
+                if schema is not None:
+                    earthquake = _parse_phivolcs_row(cells, schema, time_formats)
+                else:
+                    earthquake = _parse_phivolcs_row_heuristic(cells)
+                    if earthquake is None:
+                        stats['unrecognised_row'] += 1
                         continue
+            except ValueError as e:
+                stats[str(e)] += 1
+                continue
+            
+            stats['parsed'] += 1
+            earthquakes.append(earthquake)
+    
+    failed = sum(count for reason, count in stats.items() if reason not in ('parsed', 'skipped'))
+    if failed:
+        logger.warning('phivolcs rows failed=%d stats=%s', failed, dict(stats))
+    phivolcs_row_stats.update(stats)
+    for outcome, count in stats.items():
+        metric_inc('linogtor_phivolcs_rows_total', count, outcome=outcome)
+    
+    return annotate_earthquakes(earthquakes)
+
+def fetch_phivolcs_data(deadline=None):
+    """Fetch earthquake data from PHIVOLCS, giving up at `deadline` (a time.monotonic() value)"""
+    try:
+        # The ingest cycle owns the PHIVOLCS fetch; news and hazards reuse the page
+        page = get_phivolcs_page(refresh=True, deadline=deadline)
+        if page is None:
+            logger.warning('phivolcs all urls failed, using usgs only')
+            return []
         
-        print(f"PHIVOLCS: Found {len(earthquakes)} earthquakes")
+        earthquakes = phivolcs_page_extract(page, 'earthquakes', _extract_phivolcs_earthquakes)
+        logger.debug('phivolcs parsed events=%d', len(earthquakes))
         return earthquakes[:50]  # Return max 50 most recent
         
-    except Exception as e:
-        print(f"Error fetching PHIVOLCS data: {e}")
+    except Exception:
+        logger.exception('fetch_phivolcs_data failed')
         return []
 
+def associate_events(earthquakes, time_seconds=None, distance_km=None, magnitude=None):
+    """Merge reports of the same earthquake from different sources
+    
+    Events are swept in time order. Each one is compared with the groups
+    opened within the last `time_seconds` and joins the closest match (by
+    combined time, distance and magnitude difference, each relative to its
+    tolerance) that has no event from its source yet; otherwise it opens a
+    new group. Only the open groups are compared, so this scales to the
+    full history. Repeated ids are dropped.
+    
+    Returns one event per group, newest first. It is the origin from the
+    most preferred source, and when other sources reported the same event
+    they are listed under `associated`.
+    """
+    time_ms = (ASSOCIATION_TIME_SECONDS if time_seconds is None else time_seconds) * 1000
+    distance_km = ASSOCIATION_DISTANCE_KM if distance_km is None else distance_km
+    magnitude = ASSOCIATION_MAGNITUDE if magnitude is None else magnitude
+    
+    groups = []
+    open_groups = deque()
+    seen_ids = set()
+    
+    for eq in sorted(earthquakes, key=itemgetter('timestamp')):
+        if eq['id'] in seen_ids:
+            continue
+        seen_ids.add(eq['id'])
+        
+        # Groups are anchored on their first event, so they close in order
+        while open_groups and eq['timestamp'] - open_groups[0][0]['timestamp'] > time_ms:
+            open_groups.popleft()
+        
+        best, best_score = None, None
+        source = eq.get('source')
+        for group in open_groups:
+            anchor = group[0]
+            if any(member.get('source') == source for member in group):
+                continue
+            
+            distance = calculate_distance(anchor['latitude'], anchor['longitude'], eq['latitude'], eq['longitude'])
+            magnitude_diff = (abs(anchor['magnitude'] - eq['magnitude'])
+                              if anchor.get('magnitude') is not None and eq.get('magnitude') is not None else 0)
+            if distance > distance_km or magnitude_diff > magnitude:
+                continue
+            
+            score = ((eq['timestamp'] - anchor['timestamp']) / time_ms if time_ms else 0) + \
+                distance / distance_km + (magnitude_diff / magnitude if magnitude else 0)
+            if best is None or score < best_score:
+                best, best_score = group, score
+        
+        if best is not None:
+            best.append(eq)
+        else:
+            group = [eq]
+            groups.append(group)
+            open_groups.append(group)
+    
+    def preference(eq):
+        source = eq.get('source')
+        if source in ASSOCIATION_SOURCE_PREFERENCE:
+            return ASSOCIATION_SOURCE_PREFERENCE.index(source)
+        return len(ASSOCIATION_SOURCE_PREFERENCE)
+    
+    merged = []
+    for group in groups:
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        
+        preferred = min(group, key=preference)
+        merged.append({
+            **preferred,
+            'associated': [
+                {'id': member['id'], 'source': member.get('source'), 'magnitude': member.get('magnitude')}
+                for member in group if member is not preferred
+            ]
+        })
+    
+    merged.sort(key=itemgetter('timestamp'), reverse=True)
+    return merged
+
+# Last successful earthquakes per source: (EventTable, fetched_at). A
+# source that fails or times out is served from here and listed in the
+# result's stale_sources; the events themselves are left as they were, so
+# an outage doesn't show up as every one of them being updated.
+_source_last_good = {}
+
+def _timed_fetch(source, fetch):
+    """Run one source's fetcher, recording how long it took"""
+    started = time.perf_counter()
+    try:
+        return fetch()
+    finally:
+        metric_observe('linogtor_source_fetch_duration_seconds', time.perf_counter() - started, source=source)
+
 def fetch_earthquake_data():
     """Fetch and merge earthquake data from multiple sources"""
     try:
@@ -551,52 +1854,70 @@ def fetch_earthquake_data():
             'phivolcs': False
         }
         errors = []
+        stale_sources = {}
+        
+        def use_last_good(source, reason):
+            last_good = _source_last_good.get(source)
+            if last_good is None:
+                return
+            table, fetched_at = last_good
+            all_earthquakes.extend(table.rows())
+            stale_sources[source] = {'last_success': _format_utc(fetched_at), 'reason': reason}
+            logger.warning('fetch stale source=%s events=%d age_s=%d',
+                           source, len(table), time.time() - fetched_at)
         
-        # Fetch from USGS
-        print("Fetching from USGS...")
-        usgs_result = fetch_usgs_data()
-        if usgs_result['success']:
-            for eq in usgs_result['earthquakes']:
-                eq['source'] = 'USGS'
+        # Fetch all sources concurrently under one overall deadline. Sources
+        # that miss it are reported as timed out; their threads finish on
+        # their own request timeouts but nothing waits for them. Requests and
+        # retries are cut off at the deadline, so no result is thrown away late.
+        logger.debug('fetch start sources=usgs,phivolcs')
+        deadline = time.monotonic() + FETCH_DEADLINE_SECONDS
+        futures = {
+            _fetch_executor.submit(_timed_fetch, 'usgs', lambda: fetch_usgs_data(deadline=deadline)): 'usgs',
+            _fetch_executor.submit(_timed_fetch, 'phivolcs',
+                                   lambda: fetch_phivolcs_data(deadline=deadline)): 'phivolcs'
+        }
+        done, not_done = wait(futures, timeout=FETCH_DEADLINE_SECONDS)
+        results = {futures[future]: future.result() for future in done}
+        
+        for future in not_done:
+            future.cancel()
+            source = futures[future]
+            errors.append(f"{source.upper()}: Timed out after {FETCH_DEADLINE_SECONDS}s")
+            metric_inc('linogtor_source_fetch_failures_total', source=source, reason='timeout')
+            logger.warning('fetch timeout source=%s deadline_s=%s', source, FETCH_DEADLINE_SECONDS)
+            use_last_good(source, 'timeout')
+        
+        usgs_result = results.get('usgs')
+        if usgs_result and usgs_result['success']:
             all_earthquakes.extend(usgs_result['earthquakes'])
             sources_status['usgs'] = True
-            print(f"USGS: Successfully fetched {len(usgs_result['earthquakes'])} earthquakes")
-        else:
+            _source_last_good['usgs'] = (usgs_result['table'], time.time())
+            logger.info('fetch ok source=usgs events=%d', len(usgs_result['earthquakes']))
+        elif usgs_result:
             errors.append(f"USGS: {usgs_result.get('error', 'Unknown error')}")
-            print(f"USGS fetch failed: {usgs_result.get('error')}")
+            metric_inc('linogtor_source_fetch_failures_total', source='usgs', reason='error')
+            logger.warning('fetch failed source=usgs error=%r', usgs_result.get('error'))
+            use_last_good('usgs', 'error')
         
-        # Fetch from PHIVOLCS
-        print("Fetching from PHIVOLCS...")
-        phivolcs_earthquakes = fetch_phivolcs_data()
+        phivolcs_earthquakes = results.get('phivolcs')
         if phivolcs_earthquakes:
             all_earthquakes.extend(phivolcs_earthquakes)
             sources_status['phivolcs'] = True
-            print(f"PHIVOLCS: Successfully fetched {len(phivolcs_earthquakes)} earthquakes")
-        else:
+            _source_last_good['phivolcs'] = (EventTable(phivolcs_earthquakes), time.time())
+            logger.info('fetch ok source=phivolcs events=%d', len(phivolcs_earthquakes))
+        elif 'phivolcs' in results:
             errors.append("PHIVOLCS: No data retrieved")
-            print("PHIVOLCS fetch returned no data")
-        
-        # Remove duplicates based on time, location, and magnitude
-        unique_earthquakes = []
-        seen = set()
-        
-        for eq in all_earthquakes:
-            # Create a key for deduplication
-            key = (
-                round(eq['latitude'], 2),
-                round(eq['longitude'], 2),
-                round(eq['magnitude'], 1),
-                eq['timestamp'] // 60000  # Round to minute
-            )
-            
-            if key not in seen:
-                seen.add(key)
-                unique_earthquakes.append(eq)
+            metric_inc('linogtor_source_fetch_failures_total', source='phivolcs', reason='no_data')
+            logger.warning('fetch failed source=phivolcs error=%r', 'no data')
+            use_last_good('phivolcs', 'no_data')
         
-        # Sort by time (most recent first)
-        unique_earthquakes.sort(key=lambda x: x['timestamp'], reverse=True)
+        # One event per earthquake, even when both sources reported it
+        unique_earthquakes = associate_events(all_earthquakes)
+        metric_set('linogtor_association_input_events', len(all_earthquakes))
+        metric_set('linogtor_association_output_events', len(unique_earthquakes))
         
-        print(f"Total unique earthquakes: {len(unique_earthquakes)}")
+        logger.info('merge input_events=%d unique_events=%d', len(all_earthquakes), len(unique_earthquakes))
         
         result = {
             'success': True,
@@ -609,11 +1930,13 @@ def fetch_earthquake_data():
         
         if errors:
             result['warnings'] = errors
+        if stale_sources:
+            result['stale_sources'] = stale_sources
         
         return result
         
     except Exception as e:
-        print(f"Error in fetch_earthquake_data: {e}")
+        logger.exception('fetch_earthquake_data failed')
         return {
             'success': False,
             'error': str(e),
@@ -621,175 +1944,1751 @@ def fetch_earthquake_data():
             'sources': {'usgs': False, 'phivolcs': False}
         }
 
+# ---------------------------------------------------------------------------
+# Persistent event store
+#
+# Every earthquake the ingest path publishes is upserted into SQLite, keyed
+# by event id and indexed by time, magnitude and grid cell. History is kept
+# beyond the 7-day upstream window, and a cold process seeds its first
+# snapshot from disk instead of waiting on USGS/PHIVOLCS.
+# ---------------------------------------------------------------------------
+
+# Connections are pooled per process rather than held per thread: under
+# gevent threading.local is per greenlet, so every request would otherwise
+# open its own connection and rerun the schema
+_event_store_pool = queue.LifoQueue()
+_event_store_schema_lock = threading.Lock()
+_event_store_schema_ready = False
+_event_store_disabled = not EVENT_DB_PATH
+
+def grid_cell(lat, lon):
+    """Return the integer id of the EVENT_GRID_DEGREES cell containing a point"""
+    row = int(math.floor((lat + 90) / EVENT_GRID_DEGREES))
+    col = int(math.floor((lon + 180) / EVENT_GRID_DEGREES))
+    return row * 1000 + col
+
+def grid_cells_for_bbox(min_lat, max_lat, min_lon, max_lon):
+    """Return every grid cell id overlapping a bounding box"""
+    rows = range(int(math.floor((min_lat + 90) / EVENT_GRID_DEGREES)),
+                 int(math.floor((max_lat + 90) / EVENT_GRID_DEGREES)) + 1)
+    cols = range(int(math.floor((min_lon + 180) / EVENT_GRID_DEGREES)),
+                 int(math.floor((max_lon + 180) / EVENT_GRID_DEGREES)) + 1)
+    return [row * 1000 + col for row in rows for col in cols]
+
+class SpatialGrid:
+    """Grid index over the rows of an EventTable for bounding-box and radius queries
+    
+    Uses the same EVENT_GRID_DEGREES cells as the event store, so a query
+    only visits the cells it overlaps instead of scanning every event.
+    """
+    
+    def __init__(self, table):
+        self.table = table
+        self.cells = {}
+        latitudes = table.numeric.get('latitude', ())
+        longitudes = table.numeric.get('longitude', ())
+        for row in range(len(table)):
+            self.cells.setdefault(grid_cell(latitudes[row], longitudes[row]), []).append(row)
+    
+    def within_bbox(self, min_lat, max_lat, min_lon, max_lon):
+        """Return the rows inside a bounding box, in table order"""
+        cells = grid_cells_for_bbox(min_lat, max_lat, min_lon, max_lon)
+        if len(cells) > len(self.cells):
+            cells = self.cells.keys()
+        
+        latitudes = self.table.numeric['latitude'] if self.cells else ()
+        longitudes = self.table.numeric['longitude'] if self.cells else ()
+        return sorted(
+            row
+            for cell in cells
+            for row in self.cells.get(cell, ())
+            if min_lat <= latitudes[row] <= max_lat and min_lon <= longitudes[row] <= max_lon
+        )
+    
+    def within_radius(self, lat, lon, radius_km):
+        """Return (row, distance_km) pairs within radius_km of a point, in table order"""
+        # Bounding box of the circle; a degree of latitude is ~111.2 km
+        dlat = radius_km / 111.2
+        dlon = radius_km / (111.2 * max(math.cos(math.radians(lat)), 0.01))
+        
+        candidates = self.within_bbox(lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+        if not candidates:
+            return []
+        
+        latitudes = self.table.numeric['latitude']
+        longitudes = self.table.numeric['longitude']
+        distances = calculate_distances([latitudes[row] for row in candidates],
+                                        [longitudes[row] for row in candidates], [(lat, lon)])
+        return [(row, float(distances[i][0])) for i, row in enumerate(candidates) if distances[i][0] <= radius_km]
+
+def _open_event_store():
+    """Open a SQLite connection, creating the schema on the process's first one"""
+    global _event_store_schema_ready
+    
+    conn = sqlite3.connect(EVENT_DB_PATH, timeout=10, check_same_thread=False)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if _event_store_schema_ready:
+        return conn
+    
+    with _event_store_schema_lock:
+        if not _event_store_schema_ready:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS earthquakes (
+                    id TEXT PRIMARY KEY,
+                    source TEXT,
+                    timestamp INTEGER NOT NULL,
+                    magnitude REAL,
+                    latitude REAL NOT NULL,
+                    longitude REAL NOT NULL,
+                    depth REAL,
+                    grid_cell INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    stored_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_earthquakes_timestamp ON earthquakes (timestamp);
+                CREATE INDEX IF NOT EXISTS idx_earthquakes_magnitude ON earthquakes (magnitude);
+                CREATE INDEX IF NOT EXISTS idx_earthquakes_grid_cell ON earthquakes (grid_cell, timestamp);
+                CREATE TABLE IF NOT EXISTS ingest_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+            _event_store_schema_ready = True
+    return conn
+
+@contextmanager
+def event_store():
+    """Check a pooled SQLite connection out for the duration of a `with` block
+    
+    Yields None if the store is disabled or cannot be opened.
+    """
+    global _event_store_disabled
+    
+    conn = None
+    if not _event_store_disabled:
+        try:
+            conn = _event_store_pool.get_nowait()
+        except queue.Empty:
+            try:
+                conn = _open_event_store()
+            except sqlite3.Error as e:
+                logger.error('event store disabled path=%s error=%r', EVENT_DB_PATH, str(e))
+                _event_store_disabled = True
+    
+    if conn is None:
+        yield None
+        return
+    
+    try:
+        yield conn
+    finally:
+        if _event_store_pool.qsize() < EVENT_STORE_POOL_SIZE:
+            _event_store_pool.put(conn)
+        else:
+            conn.close()
+
+def store_earthquakes(earthquakes, source_last_success=None):
+    """Upsert earthquakes (and per-source refresh times) into the event store"""
+    now = time.time()
+    rows = [
+        (eq['id'], eq.get('source'), eq['timestamp'], eq['magnitude'], eq['latitude'], eq['longitude'],
+         eq.get('depth'), grid_cell(eq['latitude'], eq['longitude']), json.dumps(eq), now)
+        for eq in earthquakes
+    ]
+    
+    with event_store() as conn:
+        if conn is None:
+            return
+        try:
+            with conn:
+                conn.executemany("""
+                    INSERT INTO earthquakes (id, source, timestamp, magnitude, latitude, longitude,
+                                             depth, grid_cell, payload, stored_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        source = excluded.source, timestamp = excluded.timestamp,
+                        magnitude = excluded.magnitude, latitude = excluded.latitude,
+                        longitude = excluded.longitude, depth = excluded.depth,
+                        grid_cell = excluded.grid_cell, payload = excluded.payload,
+                        stored_at = excluded.stored_at
+                """, rows)
+                if source_last_success is not None:
+                    conn.execute("INSERT OR REPLACE INTO ingest_meta (key, value) VALUES ('source_last_success', ?)",
+                                 (json.dumps(source_last_success),))
+        except sqlite3.Error as e:
+            logger.error('event store write failed error=%r', str(e))
+
+def delete_stored_earthquakes(event_ids, source=None, start_ms=None, keep_ids=None):
+    """Remove events an upstream deleted from the event store
+    
+    Deletes `event_ids`. With `source`, `start_ms` and `keep_ids` (after a
+    full sync) it also deletes that source's events from `start_ms` on that
+    are not in `keep_ids`, since the source no longer lists them.
+    """
+    with event_store() as conn:
+        if conn is None:
+            return
+        try:
+            with conn:
+                cursor = conn.execute('DELETE FROM earthquakes WHERE id IN (SELECT value FROM json_each(?))',
+                                      (json.dumps(list(event_ids)),))
+                deleted = cursor.rowcount
+                if source is not None:
+                    cursor = conn.execute("""
+                        DELETE FROM earthquakes
+                        WHERE source = ? AND timestamp >= ? AND id NOT IN (SELECT value FROM json_each(?))
+                    """, (source, start_ms, json.dumps(list(keep_ids))))
+                    deleted += cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error('event store delete failed error=%r', str(e))
+            return
+    if deleted:
+        logger.info('event store deleted events=%d source=%s', deleted, source or 'any')
+
+def query_earthquakes(start_ms, end_ms, min_magnitude=None, bbox=None, limit=HISTORY_MAX_LIMIT):
+    """Query stored earthquakes by time range, magnitude and bounding box
+    
+    `bbox` is (min_lat, max_lat, min_lon, max_lon). Results are newest first,
+    or None if the store is disabled.
+    """
+    sql = 'SELECT payload FROM earthquakes WHERE timestamp >= ? AND timestamp <= ?'
+    params = [start_ms, end_ms]
+    
+    if min_magnitude is not None:
+        sql += ' AND magnitude >= ?'
+        params.append(min_magnitude)
+    
+    if bbox is not None:
+        min_lat, max_lat, min_lon, max_lon = bbox
+        # Narrow by grid cell through the index when the box is small enough
+        cells = grid_cells_for_bbox(min_lat, max_lat, min_lon, max_lon)
+        if len(cells) <= 500:
+            sql += f" AND grid_cell IN ({','.join('?' * len(cells))})"
+            params.extend(cells)
+        sql += ' AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?'
+        params.extend([min_lat, max_lat, min_lon, max_lon])
+    
+    sql += ' ORDER BY timestamp DESC LIMIT ?'
+    params.append(limit)
+    
+    with event_store() as conn:
+        if conn is None:
+            return None
+        return [json.loads(payload) for (payload,) in conn.execute(sql, params)]
+
+def load_stored_snapshot_data():
+    """Rebuild the last window of earthquakes from disk for a cold start
+    
+    Returns (data, source_last_success, stored_at) or None if nothing is stored.
+    """
+    try:
+        now_ms = int(time.time() * 1000)
+        earthquakes = query_earthquakes(now_ms - USGS_WINDOW_DAYS * 86400000, now_ms)
+        if not earthquakes:
+            return None
+        
+        with event_store() as conn:
+            if conn is None:
+                return None
+            stored_at = conn.execute('SELECT MAX(stored_at) FROM earthquakes').fetchone()[0]
+            meta = conn.execute("SELECT value FROM ingest_meta WHERE key = 'source_last_success'").fetchone()
+        source_last_success = json.loads(meta[0]) if meta else dict.fromkeys(EARTHQUAKE_SOURCES)
+    except sqlite3.Error as e:
+        logger.error('event store load failed error=%r', str(e))
+        return None
+    
+    data = {
+        'success': True,
+        'earthquakes': earthquakes,
+        'total_count': len(earthquakes),
+        'cebu_count': sum(1 for eq in earthquakes if eq['in_cebu']),
+        'sources': dict.fromkeys(EARTHQUAKE_SOURCES, False),
+        'warnings': ['Serving stored data until the first refresh completes'],
+        'last_updated': _format_utc(stored_at)
+    }
+    return data, source_last_success, stored_at
+
+# ---------------------------------------------------------------------------
+# Rolling statistics
+#
+# Aggregates for /api/stats, /api/bogo-updates and the watchlist feeds are
+# maintained as events are added, updated and removed, instead of being
+# recomputed over every event per request. Each published snapshot applies
+# its change-log entry and stores a summary, so the stats endpoints only
+# read it.
+# ---------------------------------------------------------------------------
+
+def _within_bogo(radius_km):
+    return lambda eq: eq.get('distance_from_bogo_km') is not None and eq['distance_from_bogo_km'] <= radius_km
+
+# Subsets of events that keep their own aggregates
+STATS_SCOPES = {
+    'all': lambda eq: True,
+    'cebu': lambda eq: bool(eq.get('in_cebu')),
+    'bogo_100km': _within_bogo(100),
+    'bogo_50km': _within_bogo(50)
+}
+# Time windows counted back from the snapshot time, in seconds
+STATS_WINDOWS = {'last_hour': 3600, 'last_24h': 86400, 'last_7d': 7 * 86400}
+# Lower edges of the magnitude bands: M<2, M2-3, ..., M6+
+STATS_MAGNITUDE_EDGES = (2.0, 3.0, 4.0, 5.0, 6.0)
+# How many of the most recent events each scope summary lists
+STATS_LATEST_COUNT = 20
+
+def magnitude_band(magnitude):
+    """Name the STATS_MAGNITUDE_EDGES band a magnitude falls in"""
+    if magnitude is None:
+        return 'unknown'
+    i = bisect_right(STATS_MAGNITUDE_EDGES, magnitude)
+    if i == 0:
+        return f'M<{STATS_MAGNITUDE_EDGES[0]:g}'
+    if i == len(STATS_MAGNITUDE_EDGES):
+        return f'M{STATS_MAGNITUDE_EDGES[-1]:g}+'
+    return f'M{STATS_MAGNITUDE_EDGES[i - 1]:g}-{STATS_MAGNITUDE_EDGES[i]:g}'
+
+def _remove_sorted(values, value):
+    """Remove one occurrence of `value` from a sorted list"""
+    i = bisect_left(values, value)
+    if i < len(values) and values[i] == value:
+        del values[i]
+
+def _stats_scope_matches(eq):
+    """The STATS_SCOPES an earthquake belongs to, each with its distance from Bogo City"""
+    distance = eq.get('distance_from_bogo_km')
+    return [(name, distance) for name, member in STATS_SCOPES.items() if member(eq)]
+
+class RollingStats:
+    """Incrementally maintained aggregates over a changing set of earthquakes
+    
+    Every scope keeps its events' (timestamp, id) pairs, magnitudes and
+    distances in sorted lists, plus counts per magnitude band. Window
+    counts are then a bisect and the strongest and closest events are the
+    ends of a list.
+    
+    `match(eq)` returns the (scope, distance_km) pairs an event counts in:
+    by default the STATS_SCOPES, with distances from Bogo City. Scopes not
+    named in `scopes` only exist while they have events.
+    """
+    
+    def __init__(self, match=_stats_scope_matches, scopes=tuple(STATS_SCOPES)):
+        self.match = match
+        self.fixed = frozenset(scopes)
+        self.events = {}
+        self.scopes = {name: self._new_scope() for name in scopes}
+    
+    @staticmethod
+    def _new_scope():
+        return {'times': [], 'magnitudes': [], 'distances': [], 'bands': Counter()}
+    
+    def add(self, eq):
+        """Count an earthquake (replacing any earlier version with the same id)"""
+        self.remove(eq['id'])
+        
+        key = (eq['timestamp'], eq['id'])
+        magnitude = eq.get('magnitude')
+        matches = self.match(eq)
+        self.events[eq['id']] = (key, magnitude, matches)
+        
+        for name, distance in matches:
+            scope = self.scopes.get(name)
+            if scope is None:
+                scope = self.scopes[name] = self._new_scope()
+            insort(scope['times'], key)
+            if magnitude is not None:
+                insort(scope['magnitudes'], magnitude)
+            if distance is not None:
+                insort(scope['distances'], distance)
+            scope['bands'][magnitude_band(magnitude)] += 1
+    
+    def remove(self, event_id):
+        """Stop counting an earthquake; unknown ids are ignored"""
+        entry = self.events.pop(event_id, None)
+        if entry is None:
+            return
+        
+        key, magnitude, matches = entry
+        for name, distance in matches:
+            scope = self.scopes[name]
+            _remove_sorted(scope['times'], key)
+            if magnitude is not None:
+                _remove_sorted(scope['magnitudes'], magnitude)
+            if distance is not None:
+                _remove_sorted(scope['distances'], distance)
+            band = magnitude_band(magnitude)
+            scope['bands'][band] -= 1
+            if not scope['bands'][band]:
+                del scope['bands'][band]
+            if not scope['times'] and name not in self.fixed:
+                del self.scopes[name]
+    
+    def apply(self, table, change):
+        """Apply one change-log entry, reading new event values from `table`"""
+        for event_id in change['removed']:
+            self.remove(event_id)
+        for event_id in change['added'] + change['updated']:
+            self.add(table.get(event_id))
+    
+    def summary(self, as_of):
+        """Summarize every scope with time windows ending at `as_of` (unix seconds)"""
+        as_of_ms = as_of * 1000
+        summary = {}
+        for name, scope in self.scopes.items():
+            times = scope['times']
+            summary[name] = {
+                'count': len(times),
+                **{
+                    window: len(times) - bisect_right(times, as_of_ms - seconds * 1000, key=itemgetter(0))
+                    for window, seconds in STATS_WINDOWS.items()
+                },
+                'strongest': scope['magnitudes'][-1] if scope['magnitudes'] else 0,
+                'closest': scope['distances'][0] if scope['distances'] else 0,
+                'by_magnitude': dict(scope['bands']),
+                'latest': [event_id for _, event_id in reversed(times[-STATS_LATEST_COUNT:])]
+            }
+        return summary
+
+# What RollingStats.summary() reports for a scope with no events
+EMPTY_SCOPE_SUMMARY = {'count': 0, **dict.fromkeys(STATS_WINDOWS, 0), 'strongest': 0, 'closest': 0,
+                       'by_magnitude': {}, 'latest': []}
+
+# ---------------------------------------------------------------------------
+# Watchlist
+#
+# Named points and polygons, each with its own radius and magnitude
+# threshold, generalizing the Bogo City feed to any municipality or
+# facility. Events are matched against the watchlist as they are ingested:
+# a grid index over the entries means each added or updated event is only
+# tested against the few entries near it, and per-entry aggregates are
+# kept by a RollingStats, so the feeds never scan events or entries.
+# ---------------------------------------------------------------------------
+
+_WATCH_ID_RE = re.compile(r'[A-Za-z0-9_.-]{1,64}')
+
+def point_in_polygon(lat, lon, polygon):
+    """Ray-casting test for a point inside a ring of (lat, lon) vertices"""
+    inside = False
+    prev_lat, prev_lon = polygon[-1]
+    for vertex_lat, vertex_lon in polygon:
+        if (vertex_lat > lat) != (prev_lat > lat):
+            crossing_lon = vertex_lon + (lat - vertex_lat) * (prev_lon - vertex_lon) / (prev_lat - vertex_lat)
+            if lon < crossing_lon:
+                inside = not inside
+        prev_lat, prev_lon = vertex_lat, vertex_lon
+    return inside
+
+def watch_distance(entry, lat, lon):
+    """Distance in km from a watch entry's point, or from its polygon (0 inside)"""
+    polygon = entry['polygon']
+    if polygon is None:
+        return calculate_distance(entry['lat'], entry['lon'], lat, lon)
+    if point_in_polygon(lat, lon, polygon):
+        return 0.0
+    
+    # Nearest edge, in a local equirectangular projection around the point
+    kx = 111.2 * math.cos(math.radians(lat))
+    ky = 111.2
+    closest = math.inf
+    for (lat1, lon1), (lat2, lon2) in zip(polygon, polygon[1:] + polygon[:1]):
+        ax, ay = (lon1 - lon) * kx, (lat1 - lat) * ky
+        dx, dy = (lon2 - lon1) * kx, (lat2 - lat1) * ky
+        length = dx * dx + dy * dy
+        t = min(1.0, max(0.0, -(ax * dx + ay * dy) / length)) if length else 0.0
+        closest = min(closest, math.hypot(ax + t * dx, ay + t * dy))
+    return closest
+
+def parse_watch_entry(entry):
+    """Validate one watchlist entry and normalize it; raises ValueError
+    
+    An entry is {"id", "name", "lat", "lon"} or {"id", "name", "polygon":
+    [[lat, lon], ...]}, with optional "radius_km" (default 50 for points,
+    0 for polygons) and "min_magnitude".
+    """
+    entry_id = entry.get('id') if isinstance(entry, dict) else None
+    if not isinstance(entry_id, str) or not _WATCH_ID_RE.fullmatch(entry_id):
+        raise ValueError(f'watchlist entry id must be 1-64 letters, digits, "_", "." or "-": {entry_id!r}')
+    
+    try:
+        if 'polygon' in entry:
+            polygon = [(float(lat), float(lon)) for lat, lon in entry['polygon']]
+            if len(polygon) < 3:
+                raise ValueError('a polygon needs at least 3 vertices')
+            lats = [lat for lat, _ in polygon]
+            lons = [lon for _, lon in polygon]
+            # Label point only; matching uses the polygon itself
+            lat, lon = round(sum(lats) / len(lats), 4), round(sum(lons) / len(lons), 4)
+        else:
+            polygon = None
+            lat, lon = float(entry['lat']), float(entry['lon'])
+            lats, lons = [lat], [lon]
+        radius_km = float(entry.get('radius_km', 0 if polygon else 50))
+        min_magnitude = entry.get('min_magnitude')
+        min_magnitude = None if min_magnitude is None else float(min_magnitude)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f'watchlist entry {entry_id!r}: {e}') from None
+    
+    if not all(-90 <= lat <= 90 for lat in lats) or not all(-180 <= lon <= 180 for lon in lons):
+        raise ValueError(f'watchlist entry {entry_id!r}: coordinates out of range')
+    if not 0 <= radius_km <= 2000:
+        raise ValueError(f'watchlist entry {entry_id!r}: radius_km not in [0, 2000]')
+    
+    # Bounding box of the area widened by the radius, using slightly less
+    # than the ~111.19 km in a degree so the box always covers the circle
+    dlat = radius_km / 111.0
+    dlon = radius_km / (111.0 * max(math.cos(math.radians(max(abs(min(lats)), abs(max(lats))) + dlat)), 0.01))
+    return {
+        'id': entry_id,
+        'name': str(entry.get('name') or entry_id),
+        'kind': 'point' if polygon is None else 'polygon',
+        'lat': lat,
+        'lon': lon,
+        'polygon': polygon,
+        'radius_km': radius_km,
+        'min_magnitude': min_magnitude,
+        'bbox': (min(lats) - dlat, max(lats) + dlat, min(lons) - dlon, max(lons) + dlon)
+    }
+
+class Watchlist:
+    """Watch entries indexed by the EVENT_GRID_DEGREES cells their areas overlap
+    
+    An event is only tested against the entries registered in its own
+    cell, so matching costs the number of entries nearby rather than the
+    size of the watchlist. Entries spanning more than WATCHLIST_MAX_CELLS
+    cells are tested against every event instead.
+    """
+    
+    def __init__(self, entries):
+        self.entries = {}
+        self.cells = {}
+        self.wide = []
+        for entry in map(parse_watch_entry, entries):
+            if entry['id'] in self.entries:
+                raise ValueError(f"duplicate watchlist entry id {entry['id']!r}")
+            self.entries[entry['id']] = entry
+            cells = grid_cells_for_bbox(*entry['bbox'])
+            if len(cells) > WATCHLIST_MAX_CELLS:
+                self.wide.append(entry)
+            else:
+                for cell in cells:
+                    self.cells.setdefault(cell, []).append(entry)
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def match(self, eq):
+        """(entry id, distance_km) for every entry an earthquake falls within"""
+        lat, lon = eq['latitude'], eq['longitude']
+        magnitude = eq.get('magnitude')
+        matches = []
+        for candidates in (self.cells.get(grid_cell(lat, lon), ()), self.wide):
+            for entry in candidates:
+                min_lat, max_lat, min_lon, max_lon = entry['bbox']
+                if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+                    continue
+                if entry['min_magnitude'] is not None and (magnitude is None or magnitude < entry['min_magnitude']):
+                    continue
+                distance = watch_distance(entry, lat, lon)
+                if distance <= entry['radius_km']:
+                    matches.append((entry['id'], round(distance, 2)))
+        return matches
+
+def load_watchlist(path=WATCHLIST_PATH):
+    """Build the Watchlist from WATCHLIST_DEFAULT and the JSON list of entries at `path`
+    
+    Entries in the file replace defaults with the same id. Without a file
+    only the defaults are watched; an invalid file is logged and ignored.
+    """
+    entries = {entry['id']: entry for entry in WATCHLIST_DEFAULT}
+    if path and os.path.exists(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                loaded = json.load(f)
+            if not isinstance(loaded, list):
+                raise ValueError('expected a JSON list of entries')
+            replaced = {entry.get('id') for entry in loaded if isinstance(entry, dict)}
+            watchlist = Watchlist([entry for entry_id, entry in entries.items() if entry_id not in replaced] + loaded)
+            logger.info('watchlist loaded path=%s entries=%d wide=%d', path, len(watchlist), len(watchlist.wide))
+            return watchlist
+        except (OSError, ValueError) as e:
+            logger.error('watchlist load failed path=%s error=%r', path, str(e))
+    return Watchlist(entries.values())
+
+_watchlist = load_watchlist()
+
+# ---------------------------------------------------------------------------
+# Background ingest
+#
+# A single worker thread refreshes the merged dataset every
+# INGEST_INTERVAL_SECONDS and publishes it as a snapshot. Snapshots are
+# replaced wholesale and never mutated after publication, so request
+# handlers read `_snapshot` without locking and never touch upstream APIs.
+# ---------------------------------------------------------------------------
+
+_snapshot = None
+_snapshot_seq = 0
+_refresh_lock = threading.RLock()
+_ingest_thread = None
+_ingest_thread_lock = threading.Lock()
+_last_refresh_attempt = 0.0
+
+# Delta feed: cursors are "<epoch>-<version>". The epoch is random per ingest
+# process and shared with the workers that follow it, so a client holding a
+# cursor from before a restart (or from another host) gets a full reload.
+_snapshot_epoch = os.urandom(4).hex()
+_CURSOR_RE = re.compile(r'[0-9a-f]{8}-[0-9]+')
+CHANGE_LOG_SIZE = 500
+_change_log = deque(maxlen=CHANGE_LOG_SIZE)
+
+# Notified whenever a snapshot is published, so /api/stream can push at once
+_snapshot_published = threading.Condition()
+
+# Aggregates over the current snapshot's events, advanced by each new version
+_rolling_stats = RollingStats()
+# Per-entry aggregates for the watchlist, advanced alongside _rolling_stats
+_watch_stats = RollingStats(_watchlist.match, scopes=())
+
+def _format_utc(ts):
+    """Format a unix timestamp (seconds) the way the API reports times"""
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+
+def _dataset_digest(data):
+    """Content hash of a merged dataset, ignoring when it was fetched"""
+    content = {key: value for key, value in data.items() if key != 'last_updated'}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _diff_events(version, old_table, new_table):
+    """Record which event ids were added, updated or removed in a version"""
+    return {
+        'version': version,
+        'added': [event_id for event_id in new_table.ids if event_id not in old_table],
+        'updated': [event_id for event_id in new_table.ids
+                    if event_id in old_table and old_table.get(event_id) != new_table.get(event_id)],
+        'removed': [event_id for event_id in old_table.ids if event_id not in new_table]
+    }
+
+def build_snapshot(data, previous=None):
+    """Wrap a fetch_earthquake_data() result in a new immutable snapshot
+    
+    The earthquakes are held in an EventTable (`table`) and `data` keeps
+    the rest of the result, and `stats` summarizes the rolling aggregates as
+    of the snapshot time. If the dataset is identical to the previous
+    snapshot's, the previous `data` (including its `last_updated`), table
+    and version are carried over so response bodies, and therefore ETags,
+    stay stable between refreshes.
+    """
+    global _snapshot_seq, _rolling_stats, _watch_stats
+
+    now = time.time()
+    earthquakes = data.get('earthquakes', ())
+    last_success = dict(previous['source_last_success']) if previous else dict.fromkeys(EARTHQUAKE_SOURCES)
+    for source, ok in data.get('sources', {}).items():
+        if ok:
+            last_success[source] = now
+
+    digest = _dataset_digest(data)
+    data = {key: value for key, value in data.items() if key != 'earthquakes'}
+
+    if previous is not None and previous['digest'] == digest:
+        data = previous['data']
+        version = previous['version']
+        changed_at = previous['changed_at']
+        table = previous['table']
+        grid = previous['grid']
+    else:
+        _snapshot_seq += 1
+        version = _snapshot_seq
+        changed_at = now
+        table = EventTable(earthquakes)
+        grid = SpatialGrid(table)
+        change = _diff_events(version, previous['table'] if previous else EventTable(()), table)
+        _change_log.append(change)
+        if previous is None:
+            _rolling_stats = RollingStats()
+            _watch_stats = RollingStats(_watchlist.match, scopes=())
+        _rolling_stats.apply(table, change)
+        _watch_stats.apply(table, change)
+
+    return {
+        'version': version,
+        'cursor': f'{_snapshot_epoch}-{version}',
+        'digest': digest,
+        'table': table,
+        'grid': grid,
+        'stats': _rolling_stats.summary(now),
+        'watch': _watch_stats.summary(now),
+        'created_at': now,
+        'changed_at': changed_at,
+        'data': data,
+        'source_last_success': last_success
+    }
+
+def refresh_snapshot():
+    """Fetch all sources once and publish the result as the current snapshot"""
+    global _snapshot, _last_refresh_attempt
+
+    with _refresh_lock:
+        _last_refresh_attempt = time.time()
+        started = time.perf_counter()
+        data = fetch_earthquake_data()
+        previous = _snapshot
+
+        # Keep serving the last good earthquakes if every source failed this
+        # cycle, but report the failed sources and warnings
+        if previous is not None and not any(data.get('sources', {}).values()):
+            logger.warning('ingest all sources failed, keeping snapshot version=%d', previous['version'])
+            data = {
+                **previous['data'],
+                'earthquakes': previous['table'].rows(),
+                'sources': data.get('sources', {}),
+                'warnings': data.get('warnings', []),
+                'stale_sources': data.get('stale_sources', {})
+            }
+
+        snapshot = build_snapshot(data, previous)
+        # News and hazards are published with the snapshot so that followers
+        # never fetch PHIVOLCS or NDRRMC themselves
+        snapshot['hazards'] = fetch_hazard_hunter_data(snapshot['changed_at'])
+        snapshot['news'] = fetch_phivolcs_facebook_posts(snapshot['changed_at'])
+        _snapshot = snapshot
+        logger.info('ingest published version=%d events=%d', _snapshot['version'], len(_snapshot['table']))
+        
+        # Persist only what changed in this version (build_snapshot logged it)
+        if previous is None or _snapshot['version'] != previous['version']:
+            changes = _change_log[-1]
+            store_earthquakes([_snapshot['table'].get(event_id) for event_id in changes['added'] + changes['updated']],
+                              _snapshot['source_last_success'])
+        metric_observe('linogtor_ingest_duration_seconds', time.perf_counter() - started)
+        if _ingest_leader:
+            publish_shared_snapshot(_snapshot)
+        with _snapshot_published:
+            _snapshot_published.notify_all()
+        return _snapshot
+
+def seed_snapshot_from_store():
+    """Publish a first snapshot from the event store, keeping its real age"""
+    global _snapshot
+    
+    stored = load_stored_snapshot_data()
+    if stored is None:
+        return
+    
+    data, source_last_success, stored_at = stored
+    snapshot = build_snapshot(data)
+    snapshot['created_at'] = stored_at
+    snapshot['stats'] = _rolling_stats.summary(stored_at)
+    snapshot['watch'] = _watch_stats.summary(stored_at)
+    snapshot['source_last_success'] = source_last_success
+    snapshot['hazards'] = fetch_hazard_hunter_data(snapshot['changed_at'], upstream=False)
+    snapshot['news'] = fetch_phivolcs_facebook_posts(snapshot['changed_at'], upstream=False)
+    _snapshot = snapshot
+    logger.info('ingest seeded from store version=%d events=%d age_s=%d',
+                snapshot['version'], len(data['earthquakes']), int(time.time() - stored_at))
+    if _ingest_leader:
+        publish_shared_snapshot(snapshot)
+
+# ---------------------------------------------------------------------------
+# Shared snapshot across workers
+#
+# One process per host, the holder of an flock on SHARED_SNAPSHOT_DIR's
+# ingest.lock, fetches upstream and writes each snapshot to snapshot.bin
+# (written aside, then renamed over the old one). The other workers poll
+# the file and map it: numeric event columns are read in place from the
+# mapping, and only object columns and the grid index are rebuilt per
+# process. Versions, cursors and the change log are the leader's, so a
+# cursor is valid on every worker. When the leader exits the kernel drops
+# its lock and the next worker to try takes over, continuing the sequence.
+# ---------------------------------------------------------------------------
+
+_shared_snapshot_disabled = not SHARED_SNAPSHOT_DIR or fcntl is None
+_ingest_leader = False
+_ingest_lock_file = None
+_ingest_lock_guard = threading.Lock()
+_shared_snapshot_stamp = None
+
+def _shared_snapshot_path():
+    return os.path.join(SHARED_SNAPSHOT_DIR, 'snapshot.bin')
+
+def _check_shared_snapshot_dir():
+    """Create SHARED_SNAPSHOT_DIR private to this user, or check an existing one
+    
+    Raises PermissionError if another user owns the directory or can write
+    to it: they could plant a snapshot.bin that every follower would serve.
+    """
+    os.makedirs(SHARED_SNAPSHOT_DIR, mode=0o700, exist_ok=True)
+    stat = os.stat(SHARED_SNAPSHOT_DIR)
+    if stat.st_uid != os.getuid():
+        raise PermissionError(f'{SHARED_SNAPSHOT_DIR} is owned by uid {stat.st_uid}, not {os.getuid()}')
+    if stat.st_mode & 0o022:
+        raise PermissionError(f'{SHARED_SNAPSHOT_DIR} is writable by other users (mode {stat.st_mode & 0o777:o})')
+
+def acquire_ingest_lock():
+    """Try to make this process the host's ingest leader
+    
+    Returns True if this process should fetch upstream itself: it holds the
+    lock, or snapshots aren't shared. Never blocks.
+    """
+    global _ingest_leader, _ingest_lock_file, _shared_snapshot_disabled
+    
+    if _shared_snapshot_disabled or _ingest_leader:
+        return True
+    
+    with _ingest_lock_guard:
+        if _ingest_leader:
+            return True
+        try:
+            if _ingest_lock_file is None:
+                _check_shared_snapshot_dir()
+                _ingest_lock_file = open(os.path.join(SHARED_SNAPSHOT_DIR, 'ingest.lock'), 'a')
+            fcntl.flock(_ingest_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            logger.error('shared snapshot disabled dir=%s error=%r', SHARED_SNAPSHOT_DIR, str(e))
+            _shared_snapshot_disabled = True
+            return True
+        _ingest_leader = True
+    
+    logger.info('ingest leader pid=%d dir=%s', os.getpid(), SHARED_SNAPSHOT_DIR)
+    _take_over_shared_snapshot()
+    return True
+
+def _take_over_shared_snapshot():
+    """Continue from the last published snapshot after winning the ingest lock"""
+    global _rolling_stats, _watch_stats
+    
+    load_shared_snapshot()
+    with _refresh_lock:
+        if _snapshot is not None:
+            # Followers don't maintain the aggregates; rebuild them once
+            table = _snapshot['table']
+            everything = {'added': list(table.ids), 'updated': [], 'removed': []}
+            _rolling_stats = RollingStats()
+            _rolling_stats.apply(table, everything)
+            _watch_stats = RollingStats(_watchlist.match, scopes=())
+            _watch_stats.apply(table, everything)
+
+def _encode_shared_snapshot(snapshot):
+    """Serialize a snapshot: magic, header length, JSON header, raw numeric columns"""
+    table = snapshot['table']
+    columns = {}
+    buffers = []
+    offset = 0
+    for field, values in table.numeric.items():
+        raw = memoryview(values).cast('B')
+        columns[field] = (offset, len(raw))
+        buffers.append(raw)
+        offset += len(raw)
+    
+    objects = {}
+    missing = {}
+    for field, values in table.objects.items():
+        objects[field] = [None if value is _MISSING else value for value in values]
+        rows = [row for row, value in enumerate(values) if value is _MISSING]
+        if rows:
+            missing[field] = rows
+    
+    header = json.dumps({
+        'epoch': _snapshot_epoch,
+        'change_log': list(_change_log),
+        'snapshot': {key: value for key, value in snapshot.items() if key not in ('table', 'grid')},
+        'fields': table.fields,
+        'columns': columns,
+        'objects': objects,
+        'missing': missing
+    }, default=str).encode('utf-8')
+    # Keep the columns 8-byte aligned in the mapping
+    header += b' ' * (-len(header) % 8)
+    return [SHARED_SNAPSHOT_MAGIC, len(header).to_bytes(8, 'little'), header, *buffers]
+
+def _shared_snapshot_table(buffer, header, header_end):
+    """EventTable whose numeric columns are views into the mapped file"""
+    view = memoryview(buffer)
+    numeric = {field: view[header_end + offset:header_end + offset + length].cast(EVENT_NUMERIC_COLUMNS[field])
+               for field, (offset, length) in header['columns'].items()}
+    objects = {field: [_intern(value) for value in values] for field, values in header['objects'].items()}
+    for field, rows in header['missing'].items():
+        for row in rows:
+            objects[field][row] = _MISSING
+    return EventTable.from_columns(header['fields'], numeric, objects)
+
+def publish_shared_snapshot(snapshot):
+    """Atomically replace the shared snapshot file with `snapshot`"""
+    path = _shared_snapshot_path()
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            for part in _encode_shared_snapshot(snapshot):
+                f.write(part)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error('shared snapshot publish failed path=%s error=%r', path, str(e))
+
+def load_shared_snapshot():
+    """Adopt the snapshot last published by the ingest leader, if it is new
+    
+    Returns True if one was adopted. A republished version (only its age and
+    source times changed) keeps this process's table and grid.
+    """
+    global _snapshot, _snapshot_seq, _snapshot_epoch, _change_log, _shared_snapshot_stamp
+    
+    if _shared_snapshot_disabled:
+        return False
+    
+    path = _shared_snapshot_path()
+    try:
+        stat = os.stat(path)
+        if (stat.st_ino, stat.st_mtime_ns) == _shared_snapshot_stamp:
+            return False
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            # The mapping outlives the file being renamed over
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return False
+    
+    if buffer[:len(SHARED_SNAPSHOT_MAGIC)] != SHARED_SNAPSHOT_MAGIC:
+        raise ValueError(f'{path} is not a shared snapshot')
+    header_start = len(SHARED_SNAPSHOT_MAGIC) + 8
+    header_end = header_start + int.from_bytes(buffer[len(SHARED_SNAPSHOT_MAGIC):header_start], 'little')
+    header = json.loads(buffer[header_start:header_end])
+    published = header['snapshot']
+    
+    with _refresh_lock:
+        previous = _snapshot
+        if previous is not None and _snapshot_epoch == header['epoch'] and previous['version'] == published['version']:
+            table, grid = previous['table'], previous['grid']
+        else:
+            table = _shared_snapshot_table(buffer, header, header_end)
+            grid = SpatialGrid(table)
+        
+        _snapshot_epoch = header['epoch']
+        _snapshot_seq = published['version']
+        _change_log = deque(header['change_log'], maxlen=CHANGE_LOG_SIZE)
+        _snapshot = {**published, 'table': table, 'grid': grid}
+        _shared_snapshot_stamp = (stat.st_ino, stat.st_mtime_ns)
+    
+    logger.debug('shared snapshot loaded version=%d events=%d', published['version'], len(table))
+    with _snapshot_published:
+        _snapshot_published.notify_all()
+    return True
+
+def _ingest_loop():
+    """Refresh the snapshot on a fixed schedule for the life of the process
+    
+    While another process holds the ingest lock, follow its published
+    snapshots instead.
+    """
+    while True:
+        if not acquire_ingest_lock():
+            try:
+                load_shared_snapshot()
+            except Exception:
+                logger.exception('shared snapshot load failed')
+            time.sleep(SHARED_SNAPSHOT_POLL_SECONDS)
+            continue
+        
+        delay = _last_refresh_attempt + INGEST_INTERVAL_SECONDS - time.time()
+        if delay > 0:
+            time.sleep(delay)
+            continue
+
+        try:
+            refresh_snapshot()
+        except Exception:
+            logger.exception('ingest refresh failed')
+
+def start_ingest_worker():
+    """Start the background ingest thread once per process"""
+    global _ingest_thread
+
+    if _ingest_thread is not None and _ingest_thread.is_alive():
+        return
+
+    with _ingest_thread_lock:
+        if _ingest_thread is None or not _ingest_thread.is_alive():
+            _ingest_thread = threading.Thread(target=_ingest_loop, name='earthquake-ingest', daemon=True)
+            _ingest_thread.start()
+
+def get_snapshot():
+    """Return the current snapshot without ever fetching upstream
+    
+    A stale snapshot (seeded from the event store, say) is served as is
+    while the ingest thread refreshes it. Only a process with no snapshot
+    at all waits, for the first one the ingest thread (or the ingest
+    leader) publishes.
+    """
+    start_ingest_worker()
+    
+    snapshot = _snapshot
+    while snapshot is None:
+        with _snapshot_published:
+            if _snapshot is None:
+                _snapshot_published.wait(SHARED_SNAPSHOT_POLL_SECONDS)
+        # Restarts the ingest thread if it died while we waited
+        start_ingest_worker()
+        snapshot = _snapshot
+    return snapshot
+
+def snapshot_is_stale(snapshot):
+    """Whether a snapshot is older than SNAPSHOT_MAX_AGE_SECONDS"""
+    return time.time() - snapshot['created_at'] > SNAPSHOT_MAX_AGE_SECONDS
+
+# Seed at startup so the first requests are answered from the store while
+# the ingest thread fetches fresh data
+seed_snapshot_from_store()
+
+def snapshot_delta(snapshot, cursor):
+    """Compute the changes between `cursor` and `snapshot`
+    
+    Returns a dict of added/updated/removed id lists, or None when the
+    cursor is unknown, from another epoch, or older than the change log,
+    in which case the client needs a full reload.
+    """
+    epoch, _, version = (cursor or '').partition('-')
+    if epoch != _snapshot_epoch or not version.isdigit():
+        return None
+    version = int(version)
+    if version > snapshot['version']:
+        return None
+    
+    entries = [entry for entry in list(_change_log)
+               if version < entry['version'] <= snapshot['version']]
+    if version < snapshot['version'] and (not entries or entries[0]['version'] != version + 1):
+        return None
+    
+    # An id's first change tells us whether it existed at the cursor; its
+    # presence in the snapshot tells us whether it exists now
+    existed = {}
+    for entry in entries:
+        for kind in ('added', 'updated', 'removed'):
+            for event_id in entry[kind]:
+                existed.setdefault(event_id, kind != 'added')
+    
+    delta = {'added': [], 'updated': [], 'removed': []}
+    for event_id, existed_before in existed.items():
+        exists_now = event_id in snapshot['table']
+        if existed_before and exists_now:
+            delta['updated'].append(event_id)
+        elif exists_now:
+            delta['added'].append(event_id)
+        elif existed_before:
+            delta['removed'].append(event_id)
+    return delta
+
+def snapshot_status(snapshot):
+    """Describe snapshot freshness so stale data is visible to clients"""
+    now = time.time()
+    return {
+        'version': snapshot['version'],
+        'cursor': snapshot['cursor'],
+        'snapshot_time': _format_utc(snapshot['created_at']),
+        'snapshot_age_seconds': round(now - snapshot['created_at'], 1),
+        'stale': snapshot_is_stale(snapshot),
+        'data_changed_time': _format_utc(snapshot['changed_at']),
+        'ingest_interval_seconds': INGEST_INTERVAL_SECONDS,
+        'sources': {
+            source: {
+                'last_success': _format_utc(ts),
+                'age_seconds': round(now - ts, 1) if ts is not None else None
+            }
+            for source, ts in snapshot['source_last_success'].items()
+        }
+    }
+
+# ---------------------------------------------------------------------------
+# Encoded responses
+#
+# The full earthquake list, the Bogo feed and the stats only change when a
+# snapshot is published, yet every client polls them. Their bodies are
+# serialized once per snapshot and compressed once per content encoding,
+# so a request is answered by copying bytes instead of re-encoding JSON.
+# ---------------------------------------------------------------------------
+
+# Encoded bodies for the snapshot identified by _encoded_bodies_key, keyed
+# by ETag in least recently used order
+_encoded_bodies = {}
+_encoded_bodies_key = None
+_encoded_bodies_lock = threading.Lock()
+
+def encode_json(payload):
+    """Serialize a payload to bytes the way jsonify would, with orjson if installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            # Something only Flask's provider knows how to serialize
+            pass
+    return (app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+def compress_body(raw, encoding):
+    """Compress a body for the `br` or `gzip` content encoding"""
+    if encoding == 'br':
+        return brotli.compress(raw, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(raw, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+def negotiate_encoding():
+    """The best content encoding this server offers for the request's Accept-Encoding"""
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    return request.accept_encodings.best_match(offered) or 'identity'
+
+class EncodedBody:
+    """One response body, serialized and compressed at most once per encoding
+    
+    Concurrent first requests wait for the one doing the encoding rather
+    than encoding the same body again.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._forms = {}
+    
+    def get(self, build_payload, encoding):
+        """The body in `encoding` (identity if it's too small to compress), and the encoding used"""
+        with self._lock:
+            raw = self._forms.get('identity')
+            if raw is None:
+                raw = self._forms['identity'] = encode_json(build_payload())
+            if encoding == 'identity' or len(raw) < RESPONSE_COMPRESS_MIN_BYTES:
+                return raw, 'identity'
+            body = self._forms.get(encoding)
+            if body is None:
+                body = self._forms[encoding] = compress_body(raw, encoding)
+            return body, encoding
+
+def get_encoded_body(snapshot, etag):
+    """The cached EncodedBody for `etag` in `snapshot`, created if missing"""
+    global _encoded_bodies_key
+    
+    key = (snapshot['created_at'], snapshot['cursor'])
+    with _encoded_bodies_lock:
+        if _encoded_bodies_key != key:
+            if _encoded_bodies_key is not None and key[0] < _encoded_bodies_key[0]:
+                # A request still holding an older snapshot: don't evict the new one's bodies
+                metric_inc('linogtor_response_cache_total', result='miss')
+                return EncodedBody()
+            _encoded_bodies.clear()
+            _encoded_bodies_key = key
+        
+        body = _encoded_bodies.pop(etag, None)
+        metric_inc('linogtor_response_cache_total', result='miss' if body is None else 'hit')
+        if body is None:
+            body = EncodedBody()
+            while len(_encoded_bodies) >= RESPONSE_CACHE_ENTRIES:
+                del _encoded_bodies[next(iter(_encoded_bodies))]
+        _encoded_bodies[etag] = body
+        return body
+
+def api_response(build_payload, etag=None, snapshot=None, cache=False):
+    """Build a JSON API response with a strong ETag and Cache-Control
+    
+    With an explicit `etag`, a matching If-None-Match is answered with 304
+    before `build_payload` is called; otherwise the ETag is a hash of the
+    body. Responses derived from a snapshot may be cached until the next
+    ingest is due and served stale for one more interval while revalidating.
+    
+    With `cache` (which needs `etag` and `snapshot`), the body is kept
+    encoded for the life of the snapshot and sent gzip- or brotli-compressed
+    as the client accepts; each encoding has its own ETag.
+    """
+    encoding = negotiate_encoding() if cache else 'identity'
+    tag = etag if encoding == 'identity' or etag is None else f'{etag}-{encoding}'
+    
+    if etag is not None and request.if_none_match.contains(tag):
+        response = app.response_class(status=304)
+    elif etag is not None and request.if_none_match.contains(etag):
+        # Same content the client has, just not compressed
+        response = app.response_class(status=304)
+        tag = etag
+    elif cache:
+        body, encoding = get_encoded_body(snapshot, etag).get(build_payload, encoding)
+        tag = etag if encoding == 'identity' else f'{etag}-{encoding}'
+        response = app.response_class(body, mimetype=app.json.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        metric_inc('linogtor_response_bytes_total', len(body), encoding=encoding)
+    else:
+        response = jsonify(build_payload())
+    
+    if etag is not None:
+        response.set_etag(tag)
+    else:
+        response.add_etag()
+    if cache:
+        response.vary.add('Accept-Encoding')
+    
+    max_age = INGEST_INTERVAL_SECONDS
+    if snapshot is not None:
+        max_age = max(0, int(snapshot['created_at'] + INGEST_INTERVAL_SECONDS - time.time()))
+        response.headers['X-Snapshot-Time'] = _format_utc(snapshot['created_at'])
+        response.headers['X-Snapshot-Age'] = str(int(time.time() - snapshot['created_at']))
+        if snapshot_is_stale(snapshot):
+            response.headers['X-Snapshot-Stale'] = 'true'
+    response.headers['Cache-Control'] = f'public, max-age={max_age}, stale-while-revalidate={INGEST_INTERVAL_SECONDS}'
+    
+    return response.make_conditional(request)
+
+@app.before_request
+def _start_request_timer():
+    request.environ['linogtor.started'] = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    """Record latency and status for API requests (streams: until headers are sent)"""
+    started = request.environ.get('linogtor.started')
+    if started is not None and request.url_rule is not None and request.path.startswith('/api/'):
+        endpoint = request.url_rule.rule
+        metric_observe('linogtor_http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+        metric_inc('linogtor_http_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker
+    
+    Readable with METRICS_TOKEN if one is configured, otherwise from
+    METRICS_ALLOWED_ADDRS only.
+    """
+    if METRICS_TOKEN:
+        # Compared as bytes: compare_digest rejects non-ASCII str. WSGI header
+        # values are the raw bytes decoded as latin-1.
+        allowed = hmac.compare_digest(request.headers.get('Authorization', '').encode('latin-1', 'replace'),
+                                      f'Bearer {METRICS_TOKEN}'.encode('utf-8'))
+    else:
+        allowed = request.remote_addr in METRICS_ALLOWED_ADDRS
+    if not allowed:
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    
+    snapshot = _snapshot
+    if snapshot is not None:
+        now = time.time()
+        metric_set('linogtor_snapshot_age_seconds', round(now - snapshot['created_at'], 3))
+        metric_set('linogtor_snapshot_version', snapshot['version'])
+        metric_set('linogtor_snapshot_events', len(snapshot['table']))
+        for source, ts in snapshot['source_last_success'].items():
+            if ts is not None:
+                metric_set('linogtor_source_last_success_age_seconds', round(now - ts, 3), source=source)
+    
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Render the main page"""
-    return render_template('index.html')
+    return render_template('index.html', stream_enabled=SSE_PAGE_ENABLED)
 
 @app.route('/offline.html')
 def offline():
     """Render the offline page for PWA"""
     return render_template('offline.html')
 
+def _parse_number_param(args, name, convert=float, default=None, minimum=None):
+    """Read an optional numeric query parameter
+    
+    Raises ValueError if it is malformed, not finite or below `minimum`,
+    where `args.get(name, type=...)` would silently return the default.
+    """
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        number = convert(value)
+    except ValueError:
+        raise ValueError(f'{name} must be {"an integer" if convert is int else "a number"}') from None
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be a finite number')
+    if minimum is not None and number < minimum:
+        raise ValueError(f'{name} must not be less than {minimum}')
+    return number
+
+def parse_earthquake_query(args):
+    """Read the /api/earthquakes filter, paging and projection parameters
+    
+    Raises ValueError for an unknown region, malformed numbers or times and
+    negative paging values. `fields` always includes `id` so clients can
+    merge deltas.
+    """
+    start = _parse_time_param(args.get('start'))
+    end = _parse_time_param(args.get('end'))
+    region = args.get('region', 'all')
+    if region not in EARTHQUAKE_REGION_FILTERS:
+        raise ValueError(f"region must be one of: {', '.join(EARTHQUAKE_REGION_FILTERS)}")
+    # Magnitudes of very small events can be negative, so only paging is bounded
+    min_magnitude = _parse_number_param(args, 'minmag')
+    max_magnitude = _parse_number_param(args, 'maxmag')
+    if min_magnitude is not None and max_magnitude is not None and min_magnitude > max_magnitude:
+        raise ValueError('minmag must not be greater than maxmag')
+    limit = _parse_number_param(args, 'limit', int, minimum=0)
+    offset = _parse_number_param(args, 'offset', int, default=0, minimum=0)
+    fields = args.get('fields')
+    
+    return {
+        'minmag': min_magnitude,
+        'maxmag': max_magnitude,
+        'start_ms': int(start.timestamp() * 1000) if start else None,
+        'end_ms': int(end.timestamp() * 1000) if end else None,
+        'region': region,
+        'limit': limit,
+        'offset': offset,
+        'fields': tuple(dict.fromkeys(['id'] + [field for field in fields.split(',') if field])) if fields else None
+    }
+
+def _is_filtered(query):
+    return query['region'] != 'all' or any(query[key] is not None for key in ('minmag', 'maxmag', 'start_ms', 'end_ms'))
+
+def select_earthquakes(table, query):
+    """Rows of `table`, in table order, matching a parse_earthquake_query() filter"""
+    rows = None
+    if query['minmag'] is not None or query['maxmag'] is not None:
+        rows = table.select('magnitude', query['minmag'], query['maxmag'], rows)
+    if query['start_ms'] is not None or query['end_ms'] is not None:
+        rows = table.select('timestamp', query['start_ms'], query['end_ms'], rows)
+    if query['region'] != 'all':
+        rows = EARTHQUAKE_REGION_FILTERS[query['region']](table, rows)
+    return range(len(table)) if rows is None else rows
+
+def _earthquake_page(table, query):
+    """The requested page of matching earthquakes, with paging fields if paged"""
+    rows = select_earthquakes(table, query)
+    offset, limit = query['offset'], query['limit']
+    end = len(rows) if limit is None else min(len(rows), offset + limit)
+    page = {'earthquakes': table.rows(rows[offset:end], query['fields']), 'matched_count': len(rows)}
+    if limit is not None or offset:
+        page.update({'offset': offset, 'limit': limit, 'next_offset': end if end < len(rows) else None})
+    return page
+
 @app.route('/api/earthquakes')
 def get_earthquakes():
-    """API endpoint to get earthquake data"""
-    data = fetch_earthquake_data()
-    return jsonify(data)
+    """API endpoint to get earthquake data
+    
+    Query parameters: `minmag`/`maxmag`, `start`/`end` (ISO 8601), `region` (a key of
+    EARTHQUAKE_REGION_FILTERS), `limit`/`offset` and `fields` (comma-separated
+    event fields to return). Only the selected page is serialized.
+    
+    With `?since=<cursor>` only the events added, updated or removed since
+    that cursor are returned, plus the new cursor. `full` is true when the
+    cursor could not be resolved and `earthquakes` holds the whole list.
+    Filters and `fields` apply to deltas too; `limit`/`offset` only to full
+    lists.
+    """
+    try:
+        query = parse_earthquake_query(request.args)
+        since = request.args.get('since')
+        # The cursor becomes part of the ETag, so it must be well-formed
+        if since is not None and not _CURSOR_RE.fullmatch(since):
+            raise ValueError('since must be a cursor returned by this API')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    snapshot = get_snapshot()
+    # Each distinct query is its own representation
+    query_tag = hashlib.sha1(request.query_string).hexdigest()[:16] if request.query_string else 'all'
+    
+    if since is None:
+        return api_response(lambda: {**snapshot['data'], **_earthquake_page(snapshot['table'], query),
+                                     'cursor': snapshot['cursor']},
+                            etag=f"earthquakes-{snapshot['digest']}-{snapshot['cursor']}-{query_tag}",
+                            snapshot=snapshot, cache=True)
+    
+    return api_response(lambda: _earthquakes_delta_payload(snapshot, since, query),
+                        etag=f"delta-{since}-{snapshot['cursor']}-{query_tag}", snapshot=snapshot, cache=True)
+
+def _earthquakes_delta_payload(snapshot, since, query):
+    """Build the /api/earthquakes?since= body for a snapshot
+    
+    Events that were updated out of the query's filter are reported as
+    removed.
+    """
+    table = snapshot['table']
+    payload = dict(snapshot['data'])
+    payload['since'] = since
+    payload['cursor'] = snapshot['cursor']
+    
+    delta = snapshot_delta(snapshot, since)
+    if delta is None:
+        payload['full'] = True
+        payload.update(_earthquake_page(table, query))
+        return payload
+    
+    matching = set(select_earthquakes(table, query)) if _is_filtered(query) else None
+    
+    def included(event_id):
+        return matching is None or table.index[event_id] in matching
+    
+    payload['full'] = False
+    payload['added'] = [table.get(event_id, query['fields']) for event_id in delta['added'] if included(event_id)]
+    payload['updated'] = [table.get(event_id, query['fields']) for event_id in delta['updated'] if included(event_id)]
+    payload['removed'] = delta['removed'] + [event_id for event_id in delta['updated'] if not included(event_id)]
+    return payload
+
+@app.route('/api/earthquakes/near')
+def get_earthquakes_near():
+    """API endpoint for earthquakes within `radius_km` of `lat`/`lon`
+    
+    Answered from the snapshot's spatial index, so any LGU or facility can
+    be monitored the way /api/bogo-updates monitors Bogo City.
+    """
+    try:
+        if 'lat' not in request.args or 'lon' not in request.args:
+            raise ValueError('lat and lon are required')
+        lat = _parse_number_param(request.args, 'lat')
+        lon = _parse_number_param(request.args, 'lon')
+        radius_km = _parse_number_param(request.args, 'radius_km', default=50)
+        limit = _parse_number_param(request.args, 'limit', int, default=100, minimum=0)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius_km <= 2000):
+        return jsonify({'success': False, 'error': 'lat/lon out of range or radius_km not in (0, 2000]'}), 400
+    
+    snapshot = get_snapshot()
+    return api_response(lambda: _near_payload(snapshot, lat, lon, radius_km, limit),
+                        etag=f"near-{snapshot['digest']}", snapshot=snapshot)
+
+def _near_payload(snapshot, lat, lon, radius_km, limit):
+    """Build the /api/earthquakes/near body for a snapshot"""
+    table = snapshot['table']
+    # Table order is newest first
+    matches = snapshot['grid'].within_radius(lat, lon, radius_km)
+    
+    return {
+        'success': True,
+        'center': {'lat': lat, 'lon': lon},
+        'radius_km': radius_km,
+        'earthquakes': [{**table.row(row), 'distance_km': round(distance, 2)} for row, distance in matches[:limit]],
+        'count': len(matches),
+        'strongest_magnitude': table.maximum('magnitude', [row for row, _ in matches]),
+        'closest_distance': round(min((distance for _, distance in matches), default=0), 2),
+        'last_updated': snapshot['data']['last_updated']
+    }
+
+@app.route('/api/ingest-status')
+def get_ingest_status():
+    """API endpoint describing snapshot age and per-source refresh times"""
+    status = snapshot_status(get_snapshot())
+    status['phivolcs_rows'] = dict(phivolcs_row_stats)
+    status['upstreams'] = {host: breaker.status() for host, breaker in list(_circuit_breakers.items())}
+    status['ingest'] = {
+        'pid': os.getpid(),
+        'role': 'standalone' if _shared_snapshot_disabled else 'leader' if _ingest_leader else 'follower'
+    }
+    response = jsonify(status)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/bogo-updates')
 def get_bogo_updates():
     """API endpoint to get real-time Bogo City specific earthquake updates"""
-    data = fetch_earthquake_data()
+    snapshot = get_snapshot()
+    # Time windows are evaluated as of the snapshot, so the body only
+    # changes when a new snapshot is published
+    etag = f"bogo-{snapshot['digest']}-{int(snapshot['created_at'])}"
+    return api_response(lambda: _bogo_updates_payload(snapshot), etag=etag, snapshot=snapshot, cache=True)
+
+def _bogo_updates_payload(snapshot):
+    """Build the /api/bogo-updates body for a snapshot"""
+    data = snapshot['data']
+    table = snapshot['table']
     
     if not data['success']:
-        return jsonify(data)
+        return {**data, 'earthquakes': table.rows()}
     
-    # Filter for earthquakes near Bogo City (within 100km)
-    bogo_earthquakes = [
-        eq for eq in data['earthquakes']
-        if eq['distance_from_bogo_km'] <= 100
-    ]
+    # Earthquakes near Bogo City (within 100km), from the rolling aggregates
+    bogo = snapshot['stats']['bogo_100km']
+    recent_bogo = [table.get(event_id) for event_id in bogo['latest']]
     
-    # Sort by time (most recent first)
-    bogo_earthquakes.sort(key=lambda x: x['timestamp'], reverse=True)
+    return {
+        'success': True,
+        'earthquakes': recent_bogo,
+        'stats': {
+            'total_near_bogo': bogo['count'],
+            'last_hour': bogo['last_hour'],
+            'last_24h': bogo['last_24h'],
+            'last_7d': bogo['last_7d'],
+            'within_50km': snapshot['stats']['bogo_50km']['count'],
+            'strongest_magnitude': bogo['strongest'],
+            'closest_distance': bogo['closest'],
+            'by_magnitude': bogo['by_magnitude'],
+            'latest_time': recent_bogo[0]['time'] if recent_bogo else 'No data'
+        },
+        'last_updated': data['last_updated']
+    }
+
+def _watch_entry_info(entry):
+    """The public description of a watch entry"""
+    info = {key: entry[key] for key in ('id', 'name', 'kind', 'lat', 'lon', 'radius_km', 'min_magnitude')}
+    if entry['polygon'] is not None:
+        info['polygon'] = entry['polygon']
+    return info
+
+def _watch_stats_payload(summary):
+    """Stats for one watch entry from its RollingStats summary"""
+    return {
+        'total': summary['count'],
+        'last_hour': summary['last_hour'],
+        'last_24h': summary['last_24h'],
+        'last_7d': summary['last_7d'],
+        'strongest_magnitude': summary['strongest'],
+        'closest_distance': summary['closest'],
+        'by_magnitude': summary['by_magnitude']
+    }
+
+@app.route('/api/watchlist')
+def get_watchlist():
+    """API endpoint listing the watchlist with each location's event counts"""
+    snapshot = get_snapshot()
+    etag = f"watchlist-{snapshot['digest']}-{int(snapshot['created_at'])}"
+    return api_response(lambda: _watchlist_payload(snapshot), etag=etag, snapshot=snapshot, cache=True)
+
+def _watchlist_payload(snapshot):
+    """Build the /api/watchlist body for a snapshot"""
+    watch = snapshot.get('watch', {})
+    return {
+        'success': True,
+        'locations': [
+            {**_watch_entry_info(entry), 'stats': _watch_stats_payload(watch.get(entry_id, EMPTY_SCOPE_SUMMARY))}
+            for entry_id, entry in _watchlist.entries.items()
+        ],
+        'count': len(_watchlist),
+        'last_updated': snapshot['data']['last_updated']
+    }
+
+@app.route('/api/watchlist/<entry_id>/updates')
+def get_watchlist_updates(entry_id):
+    """API endpoint for the latest earthquakes and stats of one watchlist location
+    
+    /api/bogo-updates for any watched point or polygon: events within the
+    entry's radius (or polygon) at or above its magnitude threshold.
+    """
+    entry = _watchlist.entries.get(entry_id)
+    if entry is None:
+        return jsonify({'success': False, 'error': f'Unknown watchlist location: {entry_id}'}), 404
     
-    # Get only the most recent 20 for the live feed
-    recent_bogo = bogo_earthquakes[:20]
+    snapshot = get_snapshot()
+    etag = f"watch-updates-{entry_id}-{snapshot['digest']}-{int(snapshot['created_at'])}"
+    return api_response(lambda: _watch_updates_payload(snapshot, entry), etag=etag, snapshot=snapshot, cache=True)
+
+def _watch_updates_payload(snapshot, entry):
+    """Build the /api/watchlist/<id>/updates body for a snapshot"""
+    data = snapshot['data']
+    table = snapshot['table']
     
-    # Calculate Bogo-specific stats
-    last_hour = [eq for eq in bogo_earthquakes if (time.time() * 1000 - eq['timestamp']) < 3600000]
-    last_24h = [eq for eq in bogo_earthquakes if (time.time() * 1000 - eq['timestamp']) < 86400000]
+    if not data['success']:
+        return {**data, 'location': _watch_entry_info(entry), 'earthquakes': []}
     
-    return jsonify({
+    summary = snapshot.get('watch', {}).get(entry['id'], EMPTY_SCOPE_SUMMARY)
+    earthquakes = []
+    for event_id in summary['latest']:
+        eq = table.get(event_id)
+        earthquakes.append({**eq, 'distance_km': round(watch_distance(entry, eq['latitude'], eq['longitude']), 2)})
+    
+    return {
         'success': True,
-        'earthquakes': recent_bogo,
+        'location': _watch_entry_info(entry),
+        'earthquakes': earthquakes,
         'stats': {
-            'total_near_bogo': len(bogo_earthquakes),
-            'last_hour': len(last_hour),
-            'last_24h': len(last_24h),
-            'within_50km': sum(1 for eq in bogo_earthquakes if eq['distance_from_bogo_km'] <= 50),
-            'strongest_magnitude': max((eq['magnitude'] for eq in bogo_earthquakes), default=0),
-            'closest_distance': min((eq['distance_from_bogo_km'] for eq in bogo_earthquakes), default=0) if bogo_earthquakes else 0,
-            'latest_time': recent_bogo[0]['time'] if recent_bogo else 'No data'
+            **_watch_stats_payload(summary),
+            'latest_time': earthquakes[0]['time'] if earthquakes else 'No data'
         },
         'last_updated': data['last_updated']
-    })
+    }
+
+@app.route('/api/watchlist/<entry_id>/stats')
+def get_watchlist_stats(entry_id):
+    """API endpoint for the earthquake statistics of one watchlist location"""
+    entry = _watchlist.entries.get(entry_id)
+    if entry is None:
+        return jsonify({'success': False, 'error': f'Unknown watchlist location: {entry_id}'}), 404
+    
+    snapshot = get_snapshot()
+    etag = f"watch-stats-{entry_id}-{snapshot['digest']}-{int(snapshot['created_at'])}"
+    return api_response(lambda: {
+        'success': True,
+        'location': _watch_entry_info(entry),
+        'stats': _watch_stats_payload(snapshot.get('watch', {}).get(entry_id, EMPTY_SCOPE_SUMMARY)),
+        'last_updated': snapshot['data']['last_updated']
+    }, etag=etag, snapshot=snapshot, cache=True)
 
 @app.route('/api/stats')
 def get_stats():
     """API endpoint to get earthquake statistics"""
-    data = fetch_earthquake_data()
+    snapshot = get_snapshot()
+    etag = f"stats-{snapshot['digest']}-{int(snapshot['created_at'])}"
+    return api_response(lambda: _stats_payload(snapshot), etag=etag, snapshot=snapshot, cache=True)
+
+def _stats_payload(snapshot):
+    """Build the /api/stats body for a snapshot"""
+    data = snapshot['data']
     
     if not data['success']:
-        return jsonify(data)
-    
-    earthquakes = data['earthquakes']
-    
-    # Debug logging
-    print(f"\n=== STATS CALCULATION ===")
-    print(f"Total earthquakes fetched: {len(earthquakes)}")
-    
-    # Calculate statistics with detailed logging
-    in_cebu_count = 0
-    near_bogo_count = 0
-    last_24h_count = 0
-    
-    current_time = time.time() * 1000
-    
-    for eq in earthquakes:
-        # Check Cebu
-        if eq.get('in_cebu', False):
-            in_cebu_count += 1
-            print(f"  Cebu earthquake: M{eq['magnitude']} at {eq['place']}")
-        
-        # Check near Bogo (within 50km)
-        distance = eq.get('distance_from_bogo_km', float('inf'))
-        if distance < 50:
-            near_bogo_count += 1
-            print(f"  Near Bogo: M{eq['magnitude']} at {eq['place']} - {distance:.1f}km away")
-        
-        # Check last 24h
-        time_diff = current_time - eq.get('timestamp', 0)
-        if time_diff < 86400000:  # 24 hours in milliseconds
-            last_24h_count += 1
-    
-    stats = {
-        'total_philippines': len(earthquakes),
-        'in_cebu': in_cebu_count,
-        'near_bogo': near_bogo_count,
-        'major_quakes': sum(1 for eq in earthquakes if eq.get('magnitude', 0) >= 5.0),
-        'last_24h': last_24h_count,
-        'strongest': max((eq.get('magnitude', 0) for eq in earthquakes), default=0),
-        'closest_to_bogo': min((eq.get('distance_from_bogo_km', float('inf')) for eq in earthquakes), default=0) if earthquakes else 0
+        return {**data, 'earthquakes': snapshot['table'].rows()}
+    
+    # Read straight from the rolling aggregates; nothing is scanned per request
+    summary = snapshot['stats']
+    everything = summary['all']
+    return {
+        'total_philippines': everything['count'],
+        'in_cebu': summary['cebu']['count'],
+        'near_bogo': summary['bogo_50km']['count'],
+        'major_quakes': sum(count for band, count in everything['by_magnitude'].items()
+                            if band in (magnitude_band(5.0), magnitude_band(6.0))),
+        'last_hour': everything['last_hour'],
+        'last_24h': everything['last_24h'],
+        'last_7d': everything['last_7d'],
+        'strongest': everything['strongest'],
+        'closest_to_bogo': everything['closest'],
+        'by_magnitude': everything['by_magnitude']
     }
+
+@app.route('/api/stream')
+def stream_earthquakes():
+    """Server-Sent Events stream of new and updated earthquakes near a point
     
-    print(f"Stats calculated:")
-    print(f"  Total: {stats['total_philippines']}")
-    print(f"  In Cebu: {stats['in_cebu']}")
-    print(f"  Near Bogo (50km): {stats['near_bogo']}")
-    print(f"  Last 24h: {stats['last_24h']}")
-    print(f"  Strongest: M{stats['strongest']}")
-    print(f"  Closest to Bogo: {stats['closest_to_bogo']:.1f}km")
-    print(f"========================\n")
+    Query parameters: `radius_km` (default 100) and optionally `lat`/`lon`
+    (default Bogo City). Each `earthquakes` event carries the snapshot
+    cursor as its id, so a reconnecting EventSource resumes from where it
+    left off via Last-Event-ID. A `reset` event means the cursor could not
+    be resumed and the client should reload the full list.
+    """
+    try:
+        radius_km = _parse_number_param(request.args, 'radius_km', default=SSE_DEFAULT_RADIUS_KM)
+        lat = _parse_number_param(request.args, 'lat', default=BOGO_CITY_LAT)
+        lon = _parse_number_param(request.args, 'lon', default=BOGO_CITY_LON)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius_km <= 2000):
+        return jsonify({'success': False, 'error': 'lat/lon out of range or radius_km not in (0, 2000]'}), 400
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    snapshot = get_snapshot()
     
-    return jsonify(stats)
+    return Response(_stream_events(snapshot, last_event_id, lat, lon, radius_km),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-@app.route('/api/phivolcs-news')
-def get_phivolcs_news():
-    """API endpoint to get PHIVOLCS Facebook posts about Bogo City"""
-    try:
-        posts = fetch_phivolcs_facebook_posts()
+def _stream_events(snapshot, cursor, lat, lon, radius_km):
+    """Generate SSE messages for /api/stream until the connection times out"""
+    yield f'retry: {SSE_HEARTBEAT_SECONDS * 1000}\n\n'
+    if cursor is None:
+        cursor = snapshot['cursor']
+        yield f"id: {cursor}\nevent: ready\ndata: {json.dumps({'cursor': cursor})}\n\n"
+    
+    deadline = time.time() + SSE_MAX_CONNECTION_SECONDS
+    while time.time() < deadline:
+        snapshot = _snapshot
+        if snapshot['cursor'] != cursor:
+            delta = snapshot_delta(snapshot, cursor)
+            cursor = snapshot['cursor']
+            
+            if delta is None:
+                yield f"id: {cursor}\nevent: reset\ndata: {json.dumps({'cursor': cursor})}\n\n"
+                continue
+            
+            changes = []
+            for kind in ('added', 'updated'):
+                for event_id in delta[kind]:
+                    eq = snapshot['table'].get(event_id)
+                    if calculate_distance(lat, lon, eq['latitude'], eq['longitude']) <= radius_km:
+                        changes.append({**eq, 'change': kind})
+            
+            if changes:
+                payload = {'cursor': cursor, 'earthquakes': changes}
+                yield f"id: {cursor}\nevent: earthquakes\ndata: {json.dumps(payload)}\n\n"
+            else:
+                # Advance the client's Last-Event-ID without dispatching an event
+                yield f'id: {cursor}\n\n'
+            continue
         
-        return jsonify({
-            'success': True,
-            'posts': posts,
-            'count': len(posts)
-        })
-    except Exception as e:
-        print(f"Error in get_phivolcs_news endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        with _snapshot_published:
+            if _snapshot is snapshot:
+                _snapshot_published.wait(timeout=SSE_HEARTBEAT_SECONDS)
+        if _snapshot is snapshot:
+            yield ': heartbeat\n\n'
+
+@app.route('/api/history')
+def get_history():
+    """API endpoint to query stored earthquake history
+    
+    Query parameters: `start`/`end` (ISO 8601 date or time, default the last
+    HISTORY_DEFAULT_DAYS days), `minmag`, a bounding box given as
+    `minlat`/`maxlat`/`minlon`/`maxlon`, and `limit`.
+    """
+    try:
+        end = _parse_time_param(request.args.get('end')) or datetime.now(timezone.utc)
+        start = _parse_time_param(request.args.get('start')) or end - timedelta(days=HISTORY_DEFAULT_DAYS)
+        min_magnitude = _parse_number_param(request.args, 'minmag')
+        limit = min(_parse_number_param(request.args, 'limit', int, default=1000, minimum=0), HISTORY_MAX_LIMIT)
         
-        # Return empty posts instead of error to prevent UI breaking
-        return jsonify({
-            'success': True,
-            'posts': [],
-            'count': 0,
-            'error': str(e)
-        })
+        bbox = None
+        bbox_args = [request.args.get(key) for key in ('minlat', 'maxlat', 'minlon', 'maxlon')]
+        if any(arg is not None for arg in bbox_args):
+            if any(arg is None for arg in bbox_args):
+                raise ValueError('minlat, maxlat, minlon and maxlon must be given together')
+            bbox = tuple(float(arg) for arg in bbox_args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    earthquakes = query_earthquakes(int(start.timestamp() * 1000), int(end.timestamp() * 1000),
+                                    min_magnitude=min_magnitude, bbox=bbox, limit=limit)
+    if earthquakes is None:
+        return jsonify({'success': False, 'error': 'Event store is disabled'}), 503
+    
+    # Older history may hold both sources' reports of one earthquake
+    earthquakes = associate_events(earthquakes)
+    return jsonify({
+        'success': True,
+        'earthquakes': earthquakes,
+        'count': len(earthquakes),
+        'start': _format_utc(start.timestamp()),
+        'end': _format_utc(end.timestamp())
+    })
+
+def _parse_time_param(value):
+    """Parse an ISO 8601 date/time query parameter as UTC"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+@app.route('/api/phivolcs-news')
+def get_phivolcs_news():
+    """API endpoint to get PHIVOLCS Facebook posts about Bogo City
+    
+    Served from the snapshot; the ingest path fetches the posts.
+    """
+    snapshot = get_snapshot()
+    posts = snapshot.get('news', [])
+    
+    return api_response(lambda: {
+        'success': True,
+        'posts': posts,
+        'count': len(posts)
+    }, snapshot=snapshot)
 
 @app.route('/api/hazard-hunter')
 def get_hazard_hunter():
-    """API endpoint to get Hazard Hunter data for Bogo City"""
-    try:
-        hazards = fetch_hazard_hunter_data()
-        
-        return jsonify({
-            'success': True,
-            'hazards': hazards,
-            'count': len(hazards),
-            'location': {
-                'city': 'Bogo City',
-                'province': 'Cebu',
-                'country': 'Philippines',
-                'coordinates': {
-                    'lat': BOGO_CITY_LAT,
-                    'lon': BOGO_CITY_LON
-                }
+    """API endpoint to get Hazard Hunter data for Bogo City
+    
+    Served from the snapshot; the ingest path fetches the hazards.
+    """
+    snapshot = get_snapshot()
+    hazards = snapshot.get('hazards', [])
+    
+    return api_response(lambda: {
+        'success': True,
+        'hazards': hazards,
+        'count': len(hazards),
+        'location': {
+            'city': 'Bogo City',
+            'province': 'Cebu',
+            'country': 'Philippines',
+            'coordinates': {
+                'lat': BOGO_CITY_LAT,
+                'lon': BOGO_CITY_LON
             }
-        })
-    except Exception as e:
-        print(f"Error in get_hazard_hunter endpoint: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        return jsonify({
-            'success': False,
-            'hazards': [],
-            'count': 0,
-            'error': str(e)
-        })
+        }
+    }, snapshot=snapshot)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
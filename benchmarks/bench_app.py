@@ -0,0 +1,18 @@
+"""Gunicorn entry point for the load benchmark in suite.py
+
+Imports the app with the event store disabled and its upstream URLs
+pointed at the stand-in server named by LINOGTOR_BENCH_UPSTREAM.
+
+    LINOGTOR_BENCH_UPSTREAM=http://127.0.0.1:PORT gunicorn --chdir benchmarks bench_app:app
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('EVENT_DB_PATH', '')
+
+import app as linogtor
+from suite import point_app
+
+point_app(linogtor, os.environ['LINOGTOR_BENCH_UPSTREAM'])
+app = linogtor.app
@@ -0,0 +1,105 @@
+"""Benchmark the PHIVOLCS earthquake table parser against saved pages
+
+Compares the lxml parser with per-table column schemas against the
+previous approach (BeautifulSoup's html.parser and guessing every cell),
+using layouts generated from benchmarks/fixtures/phivolcs_latest.html:
+
+    latest     the page as saved
+    td_header  header cells written as <td> instead of <th>
+    suffixed   coordinates and depth written as "7.01 N", "123.44 E",
+               "102 km", the only layout the previous approach can read
+
+Timings are only comparable where both parsers find the same rows; other
+layouts are flagged as not equivalent.
+
+    python benchmarks/phivolcs_parser.py [--repeat N]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'phivolcs_latest.html')
+
+_HEADER_CELL_RE = re.compile(rb'<(/?)th\b')
+_COORDINATE_CELLS_RE = re.compile(
+    rb'(<td[^>]*>)([0-9.]+)(</td>\s*<td[^>]*>)([0-9.]+)(</td>\s*<td[^>]*>)([0-9]+)(</td>)')
+
+LAYOUTS = {
+    'latest': lambda content: content,
+    'td_header': lambda content: _HEADER_CELL_RE.sub(rb'<\1td', content),
+    'suffixed': lambda content: _COORDINATE_CELLS_RE.sub(rb'\1\2 N\3\4 E\5\6 km\7', content),
+}
+
+
+class FixtureResponse:
+    """Stand-in for the requests.Response fields the parsers read"""
+    
+    def __init__(self, content):
+        self.content = content
+        self.url = 'https://earthquake.phivolcs.dost.gov.ph/'
+
+
+def parse_baseline(response):
+    """html.parser walk of every row, guessing each cell's field"""
+    soup = BeautifulSoup(response.content, 'html.parser')
+    earthquakes = []
+    for row in soup.find_all('tr'):
+        cells = [cell.text.strip() for cell in row.find_all('td')]
+        if len(cells) >= 6:
+            earthquake = app._parse_phivolcs_row_heuristic(cells)
+            if earthquake is not None:
+                earthquakes.append(earthquake)
+    return app.annotate_earthquakes(earthquakes)
+
+
+def parse_current(response):
+    """lxml page parse followed by the schema-driven extractor"""
+    page = app._parse_phivolcs_page(response)
+    return app._extract_phivolcs_earthquakes(page)
+
+
+def best_of(fn, response, repeat):
+    """Return the fastest of `repeat` runs in milliseconds and the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(response)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    with open(FIXTURE_PATH, 'rb') as f:
+        content = f.read()
+    
+    print(f"{'layout':<12} {'parser':<10} {'best ms':>9} {'rows':>6}")
+    for name, transform in LAYOUTS.items():
+        response = FixtureResponse(transform(content))
+        rows = {}
+        for label, fn in (('baseline', parse_baseline), ('current', parse_current)):
+            ms, earthquakes = best_of(fn, response, args.repeat)
+            rows[label] = len(earthquakes)
+            print(f"{name:<12} {label:<10} {ms:>9.2f} {len(earthquakes):>6}")
+        
+        app.phivolcs_row_stats.clear()
+        parse_current(response)
+        print(f"{'':<12} row stats: {dict(app.phivolcs_row_stats)}")
+        if rows['baseline'] != rows['current']:
+            print(f"{'':<12} not equivalent: the baseline finds {rows['baseline']} of {rows['current']} rows, "
+                  f"so its timing is not a like-for-like comparison")
+
+
+if __name__ == '__main__':
+    main()
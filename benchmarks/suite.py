@@ -0,0 +1,563 @@
+"""Offline benchmark suite replaying recorded upstream responses
+
+Serves the USGS GeoJSON and PHIVOLCS/NDRRMC HTML fixtures in
+benchmarks/fixtures from a local stand-in server, points the app at it and
+measures:
+
+  * fetch_usgs_data, fetch_phivolcs_data and fetch_earthquake_data, cold
+    (nothing cached) and warm (conditional requests answered with 304),
+    at several fixture sizes
+  * the Flask endpoints under concurrent load in gunicorn (throughput,
+    p50/p99 latency, RSS per worker)
+
+Results are written to benchmarks/results/<time>-<git describe>.json and
+compared with the previous run, so regressions show up between versions.
+
+    python benchmarks/suite.py run [--scales 1,10,50] [--skip-load]
+    python benchmarks/suite.py compare OLD.json NEW.json
+    python benchmarks/suite.py record
+"""
+import argparse
+import copy
+import glob
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from lxml import etree, html
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, 'fixtures')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+sys.path.insert(0, REPO_DIR)
+
+USGS_FIXTURE = 'usgs_week.geojson'
+PHIVOLCS_FIXTURE = 'phivolcs_latest.html'
+NDRRMC_FIXTURE = 'ndrrmc.html'
+
+# Paths the stand-in server answers on; the app's upstream URLs are
+# rewritten to these by point_app()
+USGS_PATH = '/fdsnws/event/1/query'
+PHIVOLCS_PATH = '/phivolcs/'
+NDRRMC_PATH = '/ndrrmc/'
+
+LOAD_ENDPOINTS = (
+    '/api/earthquakes',
+    '/api/stats',
+    '/api/bogo-updates',
+    '/api/earthquakes/near?lat=11.0333&lon=124.0167&radius_km=100',
+    '/api/phivolcs-news',
+    '/api/hazard-hunter',
+)
+
+# A metric this much slower than the previous run is reported as a regression
+REGRESSION_RATIO = 1.2
+
+
+def point_app(module, base_url):
+    """Point the app's upstream URLs at the stand-in server at `base_url`"""
+    module.USGS_QUERY_URL = base_url + USGS_PATH
+    module.PHIVOLCS_URLS = [base_url + PHIVOLCS_PATH]
+    module.NDRRMC_URL = base_url + NDRRMC_PATH
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+#
+# Recorded fixtures are scaled up by repeating their events, and USGS
+# origin times are spread over the last week so the app's 7-day window
+# keeps every one of them whenever the fixture was recorded.
+# ---------------------------------------------------------------------------
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def scale_usgs(body, scale, window_days=7):
+    """Return the USGS fixture with `scale` copies of every feature"""
+    document = json.loads(body)
+    base = document['features']
+    size = len(base) * scale
+    rnd = random.Random(scale)
+    now_ms = int(time.time() * 1000)
+    span_ms = window_days * 86400 * 1000 * 0.95
+
+    features = []
+    for i in range(size):
+        source = base[i % len(base)]
+        feature = copy.deepcopy(source)
+        copy_number = i // len(base)
+        if copy_number:
+            feature['id'] = f"{source['id']}r{copy_number}"
+            coordinates = feature['geometry']['coordinates']
+            coordinates[0] = round(coordinates[0] + rnd.uniform(-0.3, 0.3), 4)
+            coordinates[1] = round(coordinates[1] + rnd.uniform(-0.3, 0.3), 4)
+        properties = feature['properties']
+        properties['time'] = now_ms - int(span_ms * i / size)
+        properties['updated'] = properties['time'] + 60 * 1000
+        features.append(feature)
+
+    document['features'] = features
+    document.setdefault('metadata', {})['count'] = size
+    return json.dumps(document, separators=(',', ':')).encode()
+
+
+def scale_phivolcs(body, scale):
+    """Return the PHIVOLCS page with the earthquake table's rows repeated `scale` times"""
+    root = html.fromstring(body)
+    table = max(root.iter('table'), key=lambda t: len(t.findall('.//tr')))
+    rows = [row for row in table.iter('tr') if row.find('td') is not None]
+    parent = rows[-1].getparent()
+    for _ in range(scale - 1):
+        for row in rows:
+            parent.append(copy.deepcopy(row))
+    return etree.tostring(root, method='html', encoding='utf-8', doctype='<!DOCTYPE html>')
+
+
+def count_usgs_features(body):
+    return json.loads(body)['metadata']['count']
+
+
+def count_phivolcs_rows(body):
+    root = html.fromstring(body)
+    return max(sum(1 for row in table.iter('tr') if row.find('td') is not None)
+               for table in root.iter('table'))
+
+
+# ---------------------------------------------------------------------------
+# Stand-in upstream server
+# ---------------------------------------------------------------------------
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        entry = self.server.bodies.get(url.path)
+        if entry is None:
+            self.send_error(404)
+            return
+
+        # An incremental USGS poll: nothing has been updated since
+        if url.path == USGS_PATH and 'updatedafter' in parse_qs(url.query):
+            entry = self.server.empty_usgs
+        body, content_type, etag = entry
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """Serves fixture bodies by path, honouring If-None-Match"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FixtureHandler)
+        self.bodies = {}
+        self.empty_usgs = self._entry(b'{"type":"FeatureCollection","features":[]}', 'application/json')
+        threading.Thread(target=self.serve_forever, name='fixture-server', daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def publish(self, path, body, content_type):
+        self.bodies[path] = self._entry(body, content_type)
+
+    @staticmethod
+    def _entry(body, content_type):
+        return body, content_type, '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(samples, elapsed=None):
+    """Latency summary in milliseconds, with throughput if `elapsed` is given"""
+    ordered = sorted(samples)
+    summary = {
+        'n': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+    if elapsed is not None:
+        summary['throughput_rps'] = round(len(ordered) / elapsed, 1)
+    return summary
+
+
+def rss_kb(pid='self'):
+    """Resident set size of a process in KiB, from /proc (None elsewhere)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def child_pids(parent_pid):
+    pids = []
+    for stat_path in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_path) as f:
+                # The command name may contain spaces; fields resume after ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent_pid:
+            pids.append(int(stat_path.split('/')[2]))
+    return sorted(pids)
+
+
+def time_calls(fn, repeat, reset=None):
+    samples = []
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def bench_functions(server, scales, repeat):
+    """Time the fetch functions in this process against each fixture scale"""
+    import app
+    point_app(app, server.base_url)
+    # Per-fetch INFO lines would swamp the table
+    logging.getLogger('linogtor').setLevel(logging.WARNING)
+
+    def reset():
+        app._upstream_cache.clear()
+        app._phivolcs_page = None
+        app._usgs_last_poll = None
+
+    cases = (
+        ('fetch_usgs_data/cold', lambda: app.fetch_usgs_data(incremental=False), reset),
+        ('fetch_usgs_data/warm', lambda: app.fetch_usgs_data(incremental=False), None),
+        ('fetch_usgs_data/incremental', lambda: app.fetch_usgs_data(incremental=True), None),
+        ('fetch_phivolcs_data/cold', app.fetch_phivolcs_data, reset),
+        ('fetch_phivolcs_data/warm', app.fetch_phivolcs_data, None),
+        ('fetch_earthquake_data/cold', app.fetch_earthquake_data, reset),
+        ('fetch_earthquake_data/warm', app.fetch_earthquake_data, None),
+    )
+
+    usgs_body = read_fixture(USGS_FIXTURE)
+    phivolcs_body = read_fixture(PHIVOLCS_FIXTURE)
+    results = {}
+    for scale in scales:
+        usgs = scale_usgs(usgs_body, scale)
+        phivolcs = scale_phivolcs(phivolcs_body, scale)
+        server.publish(USGS_PATH, usgs, 'application/json')
+        server.publish(PHIVOLCS_PATH, phivolcs, 'text/html; charset=utf-8')
+
+        key = f'x{scale}'
+        results[key] = {
+            'usgs_features': count_usgs_features(usgs),
+            'usgs_bytes': len(usgs),
+            'phivolcs_rows': count_phivolcs_rows(phivolcs),
+            'phivolcs_bytes': len(phivolcs),
+            'cases': {}
+        }
+        for name, fn, case_reset in cases:
+            # Warm cases start from a primed cache
+            if case_reset is None:
+                fn()
+            results[key]['cases'][name] = summary = time_calls(fn, repeat, case_reset)
+            print(f"{key:<5} {name:<30} p50 {summary['p50_ms']:>9.2f} ms  "
+                  f"p99 {summary['p99_ms']:>9.2f} ms")
+        results[key]['rss_kb'] = rss_kb()
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_requests(base_url, path, total, concurrency):
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        response = session.get(base_url + path, timeout=60)
+        response.content
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    summary = summarize([latency for latency, _ in outcomes], elapsed)
+    summary['errors'] = sum(1 for _, status in outcomes if status >= 400)
+    return summary
+
+
+def bench_endpoints(server, scale, workers, threads, total, concurrency, serving_mode='threaded'):
+    """Load the endpoints of a gunicorn-served app pointed at the stand-in server
+
+    `serving_mode` is passed to gunicorn.conf.py as SERVING_MODE; `threads`
+    is the gthread pool size in threaded mode.
+    """
+    server.publish(USGS_PATH, scale_usgs(read_fixture(USGS_FIXTURE), scale), 'application/json')
+    server.publish(PHIVOLCS_PATH, scale_phivolcs(read_fixture(PHIVOLCS_FIXTURE), scale),
+                   'text/html; charset=utf-8')
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    # A private shared-snapshot directory: the default one is shared with any
+    # real deployment from this checkout, whose ingest election and
+    # snapshot.bin the benchmark workers would otherwise join
+    shared_dir = tempfile.mkdtemp(prefix='linogtor-bench-')
+    env = dict(os.environ, LINOGTOR_BENCH_UPSTREAM=server.base_url, EVENT_DB_PATH='',
+               SHARED_SNAPSHOT_DIR=shared_dir, LOG_LEVEL='WARNING', SERVING_MODE=serving_mode,
+               GUNICORN_THREADS=str(threads))
+    gunicorn = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+         '--chdir', BENCHMARKS_DIR, '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--log-level', 'warning', 'bench_app:app'],
+        env=env)
+
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                requests.get(base_url + '/api/ingest-status', timeout=60).raise_for_status()
+                break
+            except requests.RequestException:
+                if time.time() > deadline or gunicorn.poll() is not None:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.2)
+        # Warm up until every worker has its first snapshot from the ingest
+        # leader; keep that wait out of the numbers
+        run_requests(base_url, '/api/ingest-status', workers * threads * 4, concurrency)
+
+        results = {'scale': scale, 'serving_mode': serving_mode, 'workers': workers, 'threads': threads,
+                   'concurrency': concurrency, 'endpoints': {}}
+        for path in LOAD_ENDPOINTS:
+            results['endpoints'][path] = summary = run_requests(base_url, path, total, concurrency)
+            print(f"{path:<66} {summary['throughput_rps']:>8.1f} req/s  "
+                  f"p50 {summary['p50_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms  "
+                  f"errors {summary['errors']}")
+        results['worker_rss_kb'] = {str(pid): rss_kb(pid) for pid in child_pids(gunicorn.pid)}
+        print(f"worker RSS (KiB): {results['worker_rss_kb']}")
+        return results
+    finally:
+        gunicorn.terminate()
+        gunicorn.wait(timeout=30)
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+def git_describe():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def flatten(results):
+    """Yield (metric name, value, higher is better) for every comparable number"""
+    for scale, entry in results.get('functions', {}).items():
+        for case, summary in entry['cases'].items():
+            for stat in ('p50_ms', 'p99_ms'):
+                yield f'{scale} {case} {stat}', summary[stat], False
+    for path, summary in results.get('load', {}).get('endpoints', {}).items():
+        for stat in ('p50_ms', 'p99_ms'):
+            yield f'{path} {stat}', summary[stat], False
+        yield f'{path} throughput_rps', summary['throughput_rps'], True
+    for pid, rss in results.get('load', {}).get('worker_rss_kb', {}).items():
+        if rss is not None:
+            yield 'worker max rss_kb', rss, False
+
+
+def compare(old, new, threshold=REGRESSION_RATIO):
+    """Print the metrics that moved by more than `threshold`; return the regressions"""
+    def collapse(results):
+        metrics = {}
+        for name, value, higher_is_better in flatten(results):
+            if name not in metrics or value > metrics[name][0]:
+                metrics[name] = (value, higher_is_better)
+        return metrics
+
+    old_metrics = collapse(old)
+    regressions = []
+    for name, (value, higher_is_better) in collapse(new).items():
+        if name not in old_metrics or not old_metrics[name][0] or not value:
+            continue
+        ratio = value / old_metrics[name][0]
+        worse = ratio < 1 / threshold if higher_is_better else ratio > threshold
+        better = ratio > threshold if higher_is_better else ratio < 1 / threshold
+        if worse or better:
+            print(f"{'REGRESSION' if worse else 'improved':<10} {name:<80} "
+                  f"{old_metrics[name][0]:>10.2f} -> {value:>10.2f} ({ratio:.2f}x)")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def latest_result(exclude=None):
+    paths = sorted(path for path in glob.glob(os.path.join(RESULTS_DIR, '*.json')) if path != exclude)
+    return paths[-1] if paths else None
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# Commands
+# ---------------------------------------------------------------------------
+
+def run(args):
+    scales = [int(scale) for scale in args.scales.split(',')]
+    server = FixtureServer()
+    server.publish(NDRRMC_PATH, read_fixture(NDRRMC_FIXTURE), 'text/html; charset=utf-8')
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'version': git_describe(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat
+    }
+    results['functions'] = bench_functions(server, scales, args.repeat)
+    if not args.skip_load:
+        results['load'] = bench_endpoints(server, args.load_scale or scales[0], args.workers,
+                                          args.threads, args.requests, args.concurrency, args.serving_mode)
+    server.shutdown()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{results['version']}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'results written to {os.path.relpath(path)}')
+
+    previous = args.compare or latest_result(exclude=path)
+    if previous:
+        print(f'compared with {os.path.relpath(previous)}:')
+        regressions = compare(load_json(previous), results, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+def compare_command(args):
+    regressions = compare(load_json(args.old), load_json(args.new), args.threshold)
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+def record(args):
+    """Save live upstream responses as the fixtures the suite replays"""
+    import app
+
+    def save(name, url, params=None, headers=None):
+        config = app.upstream_config(urlsplit(url).hostname)
+        response = requests.get(url, params=params, headers=headers,
+                                timeout=config['timeout'], verify=config['verify'])
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, name), 'wb') as f:
+            f.write(response.content)
+        print(f'{name}: {len(response.content)} bytes from {response.url}')
+
+    start_time = time.gmtime(time.time() - app.USGS_WINDOW_DAYS * 86400)
+    save(USGS_FIXTURE, app.USGS_QUERY_URL, params={
+        'format': 'geojson',
+        'starttime': time.strftime('%Y-%m-%dT%H:%M:%S', start_time),
+        'minlatitude': app.PHILIPPINES_MIN_LAT,
+        'maxlatitude': app.PHILIPPINES_MAX_LAT,
+        'minlongitude': app.PHILIPPINES_MIN_LON,
+        'maxlongitude': app.PHILIPPINES_MAX_LON,
+        'minmagnitude': 1.0,
+        'orderby': 'time'
+    })
+    save(PHIVOLCS_FIXTURE, app.PHIVOLCS_URLS[0], headers=app.PHIVOLCS_HEADERS)
+    save(NDRRMC_FIXTURE, app.NDRRMC_URL)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks and store the results')
+    run_parser.add_argument('--scales', default='1,10,50',
+                            help='comma-separated fixture size multipliers (default: 1,10,50)')
+    run_parser.add_argument('--repeat', type=int, default=10, help='timed calls per function case')
+    run_parser.add_argument('--skip-load', action='store_true', help='skip the gunicorn endpoint load test')
+    run_parser.add_argument('--load-scale', type=int, help='fixture multiplier for the load test (default: first scale)')
+    run_parser.add_argument('--workers', type=int, default=2)
+    run_parser.add_argument('--threads', type=int, default=8, help='threads per worker in threaded mode')
+    run_parser.add_argument('--serving-mode', choices=('threaded', 'gevent'), default='threaded')
+    run_parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    run_parser.add_argument('--concurrency', type=int, default=16)
+    run_parser.add_argument('--compare', help='results file to compare with (default: the previous run)')
+
+    compare_parser = commands.add_parser('compare', help='compare two results files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--threshold', type=float, default=REGRESSION_RATIO,
+                         help='ratio past which a change is reported (default: %(default)s)')
+        sub.add_argument('--fail-on-regression', action='store_true', help='exit 1 on any regression')
+
+    commands.add_parser('record', help='overwrite the fixtures with live upstream responses')
+
+    args = parser.parse_args()
+    return {'run': run, 'compare': compare_command, 'record': record}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
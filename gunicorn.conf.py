@@ -0,0 +1,31 @@
+"""Gunicorn settings, picked up automatically by `gunicorn app:app`
+
+SERVING_MODE selects how each worker process handles connections:
+
+    gevent    (default) gevent workers: sockets, sleeps and locks are
+              cooperative, so one process holds GUNICORN_WORKER_CONNECTIONS
+              (2000) waiting pollers, /api/stream clients and upstream
+              requests at once
+    threaded  gthread workers, GUNICORN_THREADS (64) requests at a time each.
+              An open /api/stream holds one of those threads for up to 15
+              minutes, so in this mode the page polls instead of streaming
+
+Everything else (--bind, --workers / WEB_CONCURRENCY) is set as usual.
+"""
+import os
+
+SERVING_MODE = os.environ.get('SERVING_MODE', 'gevent')
+
+if SERVING_MODE == 'gevent':
+    # The worker monkey-patches the standard library before importing the
+    # app, so requests, the ingest thread and SSE waits all yield to the loop
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+elif SERVING_MODE == 'threaded':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 64))
+else:
+    raise ValueError(f"SERVING_MODE must be 'threaded' or 'gevent', not {SERVING_MODE!r}")
+
+# Polling clients reuse their connection between requests
+keepalive = 5
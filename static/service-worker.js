@@ -1,5 +1,5 @@
 // LINOGTOR Service Worker - PWA Support
-const CACHE_NAME = 'linogtor-v1.0.0';
+const CACHE_NAME = 'linogtor-v1.1.0';
 const OFFLINE_URL = '/offline.html';
 
 // Assets to cache immediately
@@ -50,6 +50,16 @@ self.addEventListener('fetch', (event) => {
   // Skip Chrome extension requests
   if (event.request.url.startsWith('chrome-extension://')) return;
 
+  // Delta responses (/api/earthquakes?since=...) are only meaningful for the
+  // cursor that requested them, so never cache them
+  const url = new URL(event.request.url);
+  if (url.searchParams.has('since')) return;
+
+  // The event stream (/api/stream) never ends, so tee-ing it into the cache
+  // would buffer it forever; let the browser handle it directly
+  if (url.pathname === '/api/stream' ||
+      (event.request.headers.get('Accept') || '').includes('text/event-stream')) return;
+
   event.respondWith(
     fetch(event.request)
       .then((response) => {
@@ -139,10 +149,20 @@ self.addEventListener('sync', (event) => {
   }
 });
 
+// Cursor of the last background sync; lost when the worker is stopped,
+// in which case the next sync fetches the full list again
+let syncCursor = null;
+// Same projection as the page requests, so synced events patch its store as-is
+const EARTHQUAKE_FIELDS = 'id,timestamp,time,magnitude,place,latitude,longitude,depth,distance_from_bogo_km,in_cebu,source,url';
+
 async function syncEarthquakeData() {
   try {
-    const response = await fetch('/api/earthquakes');
+    const url = syncCursor
+      ? `/api/earthquakes?fields=${EARTHQUAKE_FIELDS}&since=${encodeURIComponent(syncCursor)}`
+      : `/api/earthquakes?fields=${EARTHQUAKE_FIELDS}`;
+    const response = await fetch(url);
     const data = await response.json();
+    syncCursor = data.cursor || null;
     
     // Store in IndexedDB or notify clients
     const clients = await self.clients.matchAll();